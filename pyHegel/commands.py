@@ -36,6 +36,7 @@ import sys
 import textwrap
 import threading
 import operator
+import weakref
 import numpy as np
 import StringIO
 from gc import collect as collect_garbage
@@ -48,10 +49,15 @@ from . import instruments_base
 #from . import local_config
 from . import util
 from . import config
+from . import data_writer
+from . import dev_stats
+from . import traffic
+from . import discovery_cache
 
 local_config = config.load_local_config()
 
 from .instruments_base import _writevec as writevec, _normalize_usb, _normalize_gpib, _get_visa_idns
+from .instruments_base import _get_visa_idns_cached, _visa_addr_key
 from .traces import wait
 from .util import _readfile_lastnames, _readfile_lastheaders, _readfile_lasttitles
 
@@ -62,15 +68,20 @@ __all__ = ['collect_garbage', 'traces', 'instruments', 'instruments_base', 'inst
            '_process_filename', 'get', 'setget', 'getasync', 'make_dir',
            'iprint', 'ilist', 'dlist', 'find_all_instruments', 'checkmode', 'check',
            'batch', 'sleep', 'load', 'load_all_usb', 'load_all_gpib', 'test_gpib_srq_state',
-           'task', 'top', 'kill', '_init_pyHegel_globals', '_faster_timer', 'quiet_KeyboardInterrupt']
+           'task', 'top', 'kill', '_init_pyHegel_globals', '_faster_timer', 'quiet_KeyboardInterrupt',
+           'last_timing', 'stats_enable', 'stats_top', 'stats_reset',
+           'traffic_enable', 'traffic_summary', 'traffic_dump', 'traffic_clear',
+           'header_cache', 'async_overlap', 'cache_memory', 'cache_report', 'idn_cache']
 
 # not in __all__: local_config _globaldict
 #             _Clock _update_sys_path writevec _get_dev_kw _getheaders
 #             _dev_filename _readall _readall_async _checkTracePause
-#             _itemgetter _write_conf
+#             _itemgetter _write_conf _PhaseTiming _timing_columns
 #             _Sweep _Snap _record_execafter _normalize_usb _normalize_gpib _get_visa_idns
+#             _get_visa_idns_cached _visa_addr_key
 #             _Hegel_Task _quiet_KeyboardInterrupt_Handler
-#             _greetings _load_helper _get_extra_confs
+#             _greetings _load_helper _get_extra_confs _get_formats _load_key _run_parallel_jobs
+#             async_bus_order _async_bus_stats _async_schedule _async_bus_record
 
 
 #instruments_base._globaldict = globals()
@@ -127,6 +138,19 @@ def help_pyHegel():
         copy
         spy
         record
+        last_timing
+        stats_enable
+        stats_top
+        stats_reset
+        traffic_enable
+        traffic_summary
+        traffic_dump
+        traffic_clear
+        header_cache
+        async_overlap
+        cache_memory
+        cache_report
+        idn_cache
         trace
         snap
         scope
@@ -306,24 +330,64 @@ def _get_dev_kw(dev, **extra_kw):
         dev = dev[0]
     return dev, extra_kw
 
-def _get_extra_confs(extra_conf):
+def _get_formats(devkws):
+    """
+    Returns the formats (with base_conf added) of the list of (dev, kwarg)
+    after doing their force_get. The devices of every instrument are handled
+    in their own thread (see instruments_base._parallel_calls).
+    """
+    groups = []
+    group_index = {}
+    for i, (dev, kwarg) in enumerate(devkws):
+        instr = dev.instr
+        if instr is None:
+            groups.append((None, [i]))
+            continue
+        # all the devices of an instrument share the same weakref.proxy object
+        key = id(instr)
+        if key not in group_index:
+            group_index[key] = len(groups)
+            groups.append((instr, []))
+        groups[group_index[key]][1].append(i)
+    def make_func(indices):
+        def func():
+            ret = []
+            for i in indices:
+                dev, kwarg = devkws[i]
+                dev.force_get()
+                f = dev.getformat(**kwarg)
+                f['base_conf'] = instruments_base._get_conf_header(f)
+                ret.append(f)
+            return ret
+        return func
+    calls = [(instr, make_func(indices)) for instr, indices in groups]
+    results = instruments_base._parallel_calls(calls)
+    formats = [None]*len(devkws)
+    for (instr, indices), fs in zip(groups, results):
+        for i, f in zip(indices, fs):
+            formats[i] = f
+    return formats
+
+def _get_extra_confs(extra_conf, formats=None):
+    # formats are the ones from _get_formats for the devices in extra_conf
     if extra_conf is None:
         return []
     if not isinstance(extra_conf, (list, tuple)):
         extra_conf = [extra_conf]
-    formats = []
+    if formats is None:
+        devkws = [_get_dev_kw(x) for x in extra_conf if not isinstance(x, basestring)]
+        formats = _get_formats(devkws)
+    formats = iter(formats)
+    ret = []
     for x in extra_conf:
         if isinstance(x, basestring):
             f = dict(base_hdr_name='comment', base_conf=x)
         else:
             dev, kwarg = _get_dev_kw(x)
-            dev.force_get()
-            hdr = dev.getfullname()
-            f = dev.getformat(**kwarg)
-            f['base_conf'] = instruments_base._get_conf_header(f)
-            f['base_hdr_name'] = hdr
-        formats.append(f)
-    return formats
+            f = formats.next()
+            f['base_hdr_name'] = dev.getfullname()
+        ret.append(f)
+    return ret
 
 
 def _getheaders(setdev=None, getdevs=[], root=None, npts=None, extra_conf=None):
@@ -343,15 +407,16 @@ def _getheaders(setdev=None, getdevs=[], root=None, npts=None, extra_conf=None):
         count += 1
         extra_conf.append(setdev)
     reuse_dict = {}
-    for dev in getdevs:
-        dev, kwarg = _get_dev_kw(dev)
+    # All the configurations are obtained at once, so the instruments can
+    # be queried in parallel.
+    devkws = [_get_dev_kw(dev) for dev in getdevs]
+    extra_devkws = [_get_dev_kw(x) for x in extra_conf if not isinstance(x, basestring)]
+    all_formats = _get_formats(devkws + extra_devkws)
+    for (dev, kwarg), f in zip(devkws, all_formats):
         reuse = reuse_dict.get(dev,0)
         reuse_dict[dev] = reuse + 1
-        dev.force_get()
         hdr = dev.getfullname()
-        f = dev.getformat(**kwarg)
         f['basename'] = _dev_filename(root, hdr, npts, reuse, append=f['append'])
-        f['base_conf'] = instruments_base._get_conf_header(f)
         f['base_hdr_name'] = hdr
         formats.append(f)
         multi = f['multi']
@@ -378,7 +443,7 @@ def _getheaders(setdev=None, getdevs=[], root=None, npts=None, extra_conf=None):
         else:
             hdrs.append(hdr)
             count += 1
-    formats.extend(_get_extra_confs(extra_conf))
+    formats.extend(_get_extra_confs(extra_conf, all_formats[len(devkws):]))
     return hdrs, graphsel, formats
 
 def _dev_filename(root, dev_name, npts, reuse, append=False):
@@ -401,7 +466,7 @@ def _dev_filename(root, dev_name, npts, reuse, append=False):
     n = int(np.log10(maxn))+1
     return root + '_'+ dev_name+'_%0'+('%ii'%n)+ext
 
-def _readall(devs, formats, i, async=None):
+def _readall(devs, formats, i, async=None, timing=None):
     if devs == []:
         return []
     ret = []
@@ -414,10 +479,12 @@ def _readall(devs, formats, i, async=None):
             kwarg['filename']= filename
         if async != None:
             val = dev.getasync(async=async, **kwarg)
-            if async != 3:
-                continue
         else:
             val = dev.get(**kwarg)
+        if timing is not None:
+            timing.mark('get '+dev.getfullname())
+        if async != None and async != 3:
+            continue
         if val == None:
             val = i
         if isinstance(val, (list, tuple, np.ndarray, dict)):
@@ -433,17 +500,187 @@ def _readall(devs, formats, i, async=None):
     ret = instruments_base._writevec_flatten_list(ret)
     return ret
 
-def _readall_async(devs, formats, i):
+# When True, _readall_async starts the instruments interleaving the buses
+# (see _async_schedule)
+async_bus_order = True
+_async_bus_stats = dict(points=0, wall=0., busy={})
+
+def _async_schedule(devs):
+    """
+    Returns the order in which the async tasks of devs are started and waited
+    for, and the list of (bus, instr) used.
+    The devices are grouped per instrument and the instruments per bus
+    (see instruments_base._bus_name). The first instrument of every bus is
+    started first, then the second one ... So the independent buses all
+    start working as soon as possible (reducing the trigger skew between
+    them) while the instruments sharing a bus (serialized anyway) follow.
+    """
+    buses = [] # list of (bus, list of list of indices (one per instrument))
+    bus_index = {}
+    instr_index = {}
+    instrs = []
+    for j, dev in enumerate(devs):
+        dev, kwarg = _get_dev_kw(dev)
+        instr = dev.instr
+        if instr is None:
+            # logical device
+            buses.append((None, [[j]]))
+            continue
+        key = id(instr)
+        if key in instr_index:
+            instr_index[key].append(j)
+            continue
+        bus = instruments_base._bus_name(instr)
+        instrs.append((bus, instr))
+        if bus not in bus_index:
+            bus_index[bus] = len(buses)
+            buses.append((bus, []))
+        lst = instr_index[key] = [j]
+        buses[bus_index[bus]][1].append(lst)
+    order = []
+    k = 0
+    while len(order) < len(devs):
+        for bus, lsts in buses:
+            if k < len(lsts):
+                order.extend(lsts[k])
+        k += 1
+    return order, instrs
+
+def _async_bus_record(instrs):
+    # accumulates the bus busy time of the tasks just finished
+    starts = []
+    ends = []
+    busy = _async_bus_stats['busy']
+    for bus, instr in instrs:
+        task = getattr(instr._get_async_local_data(), 'async_task', None)
+        if task is None or task.run_start is None or task.run_end is None:
+            continue
+        starts.append(task.run_start)
+        ends.append(task.run_end)
+        busy[bus] = busy.get(bus, 0.) + task.run_end - task.run_start
+    if starts:
+        _async_bus_stats['points'] += 1
+        _async_bus_stats['wall'] += max(ends) - min(starts)
+
+def async_overlap(reset=False):
+    """
+    Shows, for the async reads of sweep, record (and any user of
+    _readall_async) the time every bus was busy and the overlap: the sum of
+    the busy times divided by the elapsed time (1 means the instruments were
+    read one after the other, larger values mean they worked concurrently).
+    reset: when True, restarts the accumulation (after the display).
+    """
+    st = _async_bus_stats
+    wall = st['wall']
+    busy = st['busy']
+    if st['points'] == 0 or wall == 0:
+        print 'No async reads recorded.'
+    else:
+        print '%-40s %12s %8s'%('bus', 'busy (s)', 'busy %')
+        for bus, t in sorted(busy.items(), key=lambda x: x[1], reverse=True):
+            print '%-40s %12.3f %8.1f'%(bus[:40], t, t/wall*100)
+        print 'points: %i   elapsed: %.3f s   overlap: %.2f'%(st['points'], wall, sum(busy.values())/wall)
+    if reset:
+        st['points'] = 0
+        st['wall'] = 0.
+        st['busy'] = {}
+
+def _readall_async(devs, formats, i, timing=None):
+    # The tasks are created and read in the devs order (the results
+    # of an instrument are in the creation order) but started and waited
+    # for in the bus order.
+    if async_bus_order:
+        order, instrs = _async_schedule(devs)
+        sdevs = [devs[j] for j in order]
+        sformats = [formats[j] for j in order]
+    else:
+        instrs = []
+        sdevs, sformats = devs, formats
     try:
-        _readall(devs, formats, i, async=0)
-        _readall(devs, formats, i, async=1)
-        _readall(devs, formats, i, async=2)
-        return _readall(devs, formats, i, async=3)
+        _readall(devs, formats, i, async=0, timing=timing)
+        _readall(sdevs, sformats, i, async=1, timing=timing)
+        _readall(sdevs, sformats, i, async=2, timing=timing)
+        _async_bus_record(instrs)
+        return _readall(devs, formats, i, async=3, timing=timing)
     except KeyboardInterrupt:
         print 'Rewinding async because of keyboard interrupt'
         _readall(devs, formats, i, async=-1)
         raise
 
+class _PhaseTiming(object):
+    """
+    Accumulates the time spent in the different phases of every point
+    of a sweep or record (set, wait, get of every device, write, graph ...)
+    mark(phase) adds the time elapsed since the previous mark (or since
+    new_point) to phase.
+    """
+    def __init__(self):
+        self.phases = []
+        self.data = {}
+        self.npoints = 0
+        self.current = {}
+        self.last = None
+    def new_point(self):
+        self.end_point()
+        self.last = time.time()
+    def end_point(self):
+        if self.last is None:
+            return
+        for ph in self.current:
+            if ph not in self.data:
+                self.phases.append(ph)
+                self.data[ph] = [0.]*self.npoints
+        for ph in self.phases:
+            self.data[ph].append(self.current.get(ph, 0.))
+        self.npoints += 1
+        self.current = {}
+        self.last = None
+    def mark(self, phase):
+        now = time.time()
+        if self.last is not None:
+            self.current[phase] = self.current.get(phase, 0.) + now - self.last
+        self.last = now
+    def get(self, phase):
+        """ returns the time for phase of the current point """
+        return self.current.get(phase, 0.)
+    def arrays(self):
+        return dict([(ph, np.array(self.data[ph])) for ph in self.phases])
+    def summary(self):
+        """ prints a table of the phases sorted by total time """
+        totals = [(np.sum(self.data[ph]), ph) for ph in self.phases]
+        totals.sort(reverse=True)
+        grand_total = sum([t for t, ph in totals])
+        print 'Timing for %i points, total %.3f s'%(self.npoints, grand_total)
+        print '  %-40s %10s %10s %10s %6s'%('phase', 'total (s)', 'mean (ms)', 'max (ms)', '%')
+        for total, ph in totals:
+            d = self.data[ph]
+            print '  %-40s %10.3f %10.3f %10.3f %6.1f'%(ph, total, np.mean(d)*1e3, np.max(d)*1e3,
+                                                       100.*total/grand_total if grand_total else 0.)
+
+_last_timing = None
+
+def _timing_columns(devs):
+    """ returns the phases used for the timing columns (they are known when reading is completed) """
+    cols = ['set', 'wait']
+    for dev in devs:
+        col = 'get '+_get_dev_kw(dev)[0].getfullname()
+        if col not in cols:
+            cols.append(col)
+    return cols
+
+def last_timing(summary=False):
+    """
+    Returns a dictionnary of arrays (one element per point) of the time in s
+    spent in every phase of the last sweep or record made with the timing option
+    (set, wait, get of every device, write, graph ...).
+    With summary=True, also prints a table of the phases sorted by their total time.
+    """
+    if _last_timing is None:
+        return None
+    if summary:
+        _last_timing.summary()
+    return _last_timing.arrays()
+
 def _checkTracePause(trace):
     while trace.pause_enabled:
         wait(.1)
@@ -525,6 +762,65 @@ def _write_conf(f, formats, extra_base=None, **kwarg):
                 f.write(' '+conf)
             f.write('\n')
 
+def _open_datafile(filename, mode='w'):
+    """
+    Opens a data file that is written by the background writer thread
+    using the sweep.flush_interval and sweep.flush_size settings.
+    """
+    return data_writer.DataFile(filename, mode, flush_interval=sweep.flush_interval.get(),
+                                flush_size=sweep.flush_size.get())
+
+# number of columns of the binary files (from their header)
+_binary_ncols = weakref.WeakKeyDictionary()
+
+def _write_header_row(f, hdrs, binary=False):
+    """
+    Writes the title line (and the binary data marker when binary is True)
+    """
+    writevec(f, hdrs, pre_str='#')
+    if binary:
+        f.write(util._binary_data_header(len(hdrs)))
+        _binary_ncols[f] = len(hdrs)
+
+def _write_row(f, vals, binary=False):
+    if binary:
+        vals = instruments_base._writevec_flatten_list(vals)
+        # A wrong row length would shift all the following rows of the file.
+        ncols = _binary_ncols.get(f)
+        if ncols is not None and len(vals) != ncols:
+            raise ValueError, 'The row has %i values but the binary file %s has %i columns'%(len(vals), f.name, ncols)
+        f.write(np.asarray(vals, dtype=util._binary_data_dtype).tostring())
+    else:
+        writevec(f, vals)
+
+def _nested_indices(shape, snake=False):
+    """
+    Generates the index tuples for all the points of a nested loop
+    with the last index changing the fastest.
+    With snake=True, a level that reaches the end of its span stays there
+    and goes back in the reverse direction on the next pass (boustrophedon order)
+    instead of restarting from the first value. Then only one level changes (by
+    one step) between consecutive points.
+    """
+    n = len(shape)
+    idx = [0]*n
+    dirs = [1]*n
+    while True:
+        yield tuple(idx)
+        j = n-1
+        while j >= 0:
+            nxt = idx[j] + dirs[j]
+            if 0 <= nxt < shape[j]:
+                idx[j] = nxt
+                break
+            if snake:
+                dirs[j] = -dirs[j]
+            else:
+                idx[j] = 0
+            j -= 1
+        if j < 0:
+            return
+
 # TODO: add a sweep up down.
 #       could save in 2 files but display on same trace
 #       Add a way to put a comment in the headers
@@ -600,6 +896,16 @@ class _Sweep(instruments.BaseInstrument):
        The parameter can also be None. In that case a single file is saved containing
        but the up and down sweep.
     """)
+    flush_interval = instruments.MemoryDevice(1., min=0., doc="""
+    The data files of sweep, record and snap are written by a background thread.
+    The data is sent to that thread at least every flush_interval seconds (or
+    before if flush_size is reached). The files are always completely written
+    at the end (even after an abort or CTRL-C).
+    """)
+    flush_size = instruments.MemoryDevice(64*1024, min=1, doc="""
+    Maximum number of bytes kept in memory before sending them to the
+    background writer thread. See flush_interval.
+    """)
     next_file_i = instruments.MemoryDevice(0,doc="""
     This number is used, and incremented automatically when {next_i:02} is used (for 00 to 99).
      {next_i:03}  is used for 000 to 999, etc
@@ -635,11 +941,55 @@ class _Sweep(instruments.BaseInstrument):
         self._lastnames = []
     def _current_config(self, dev_obj=None, options={}):
         return self._conf_helper('before', 'after', 'beforewait')
+    def _list_sweep_check(self, dev, dev_opt, devs):
+        if dev_opt:
+            raise ValueError, 'list_sweep does not handle options for the sweep device'
+        if dev not in dev.instr._list_sweep_devs():
+            raise ValueError, '%s cannot do list sweeps'%dev.getfullname()
+        for d in devs:
+            d = _get_dev_kw(d)[0]
+            if d not in d.instr._list_acq_devs():
+                raise ValueError, '%s cannot do list acquisitions'%d.getfullname()
+    def _list_sweep_run(self, dev, span, devs, tm=None):
+        """
+        Performs a complete hardware list sweep.
+        Returns a list of (estimated) times and a list of the read values
+        for every point.
+        When tm (a _PhaseTiming) is given, a new point is started and the
+        arm, upload, run and fetch phases are marked.
+        """
+        n = len(span)
+        dwell = self.beforewait.get()
+        meters = [_get_dev_kw(d)[0] for d in devs]
+        if tm:
+            tm.new_point()
+        for d in meters:
+            d.instr.list_acq_arm(d, n)
+        if tm:
+            tm.mark('arm')
+        dev.instr.list_sweep_setup(dev, span, dwell)
+        if tm:
+            tm.mark('upload')
+        tme = clock.get()
+        dev.instr.list_sweep_start(dev)
+        dev.instr.list_sweep_wait(dev)
+        if tm:
+            tm.mark('run')
+        results = [np.asarray(d.instr.list_acq_fetch(d, n)).reshape(n, -1) for d in meters]
+        if tm:
+            tm.mark('fetch')
+        if results:
+            all_vals = np.concatenate(results, axis=1).tolist()
+        else:
+            all_vals = [[]]*n
+        times = tme + np.arange(n)*dwell
+        return times, all_vals
     def __repr__(self):
         return '<sweep instrument>'
     def __call__(self, dev, start, stop=None, npts=None, filename='%T.txt', rate=None,
                   close_after=False, title=None, out=None, extra_conf=None,
-                  async=False, reset=False, logspace=False, updown=False, first_wait=None):
+                  async=False, reset=False, logspace=False, updown=False, first_wait=None,
+                  binary=False, pipeline=False, timing=False, list_sweep=False):
         """
             Usage:
                 dev is the device to sweep. For more advanced uses (devices with options),
@@ -699,8 +1049,47 @@ class _Sweep(instruments.BaseInstrument):
                             after setting the first value. Use it when the first value produces
                             a large change that can temporarily overload some instruments
                             like lock-ins.
+                binary: when True, the main file is saved in binary form (the headers
+                        are the same as for text files, but the data rows are
+                        saved as float64). It is appended in chunks
+                        and can be read (with readfile) while being written.
+                        readfile then uses a memory map for fast loading.
+                        All the values to save need to be numbers.
+                        You probably want to use a filename extension like .bin
+                pipeline: when True, the next value is set immediately after the
+                          out devices are read (and after is executed). The previous
+                          point is then saved and plotted while the new value settles.
+                          Also beforewait is counted from the set (instead of starting
+                          after the before execution) so the saving and plotting are
+                          included in the wait.
+                          The sweep can then be faster, but note that the device
+                          will already be set to the next value when the sweep
+                          is aborted or paused.
+                timing: when True, the time spent in every phase of every point
+                        (set, before, wait, get of every device, after, write, graph)
+                        is recorded. A summary table is printed at the end
+                        and the arrays can be obtained with last_timing().
+                        With 'columns', the set, wait and device get times are also
+                        added as extra columns to the main file.
+                        In pipeline mode, write and graph of a point are included in
+                        the following point.
+                        With list_sweep, the phases are arm, upload, run, fetch, write
+                        and graph, and every hardware sweep (one per direction
+                        with updown) counts as a single point.
+                list_sweep: when True, the sweep is done by the instrument itself
+                            (hardware list sweep): the whole list of values is sent
+                            once to the source, all the out devices are armed to take
+                            one reading per trigger, then the sweep is started and
+                            all the data is fetched at the end. The source trigger output
+                            needs to be connected to the meters trigger inputs.
+                            beforewait is used as the time spent on every point.
+                            Only devices that support it can be used (see
+                            instruments_base.BaseInstrument.list_sweep_setup), and
+                            before, after, first_wait, async and pipeline are not used.
             SEE ALSO the sweep devices: before, after, beforewait, graph.
+            For multi-dimensional maps (nested sweeps) see sweep.nested.
         """
+        global _last_timing
         dolinspace = True
         if isinstance(start, (list, np.ndarray)):
             span = np.asarray(start)
@@ -744,6 +1133,10 @@ class _Sweep(instruments.BaseInstrument):
             # For checking only take first and last values
             span = span[[0,-1]]
         devs = self.get_alldevs(out)
+        if list_sweep:
+            self._list_sweep_check(dev, dev_opt, devs)
+            if timing == 'columns':
+                timing = True
         updown_str = self.updown.getcache()
         updown_same = False
         if updown_str == None:
@@ -811,23 +1204,47 @@ class _Sweep(instruments.BaseInstrument):
             t.set_xlabel(hdrs_leg[0])
             if logspace:
                 t.set_xlogscale()
+        timing_cols = []
+        tm = None
+        if timing:
+            tm = _last_timing = _PhaseTiming()
+            if timing == 'columns':
+                timing_cols = _timing_columns(devs)
+        file_hdrs = hdrs+['time']+['timing '+c for c in timing_cols]
+        # pending is the point waiting to be saved/shown in pipeline mode
+        pending = None
         try:
             f = None
             frev = None
             if filename != None:
-                # Make it unbuffered, windows does not handle line buffer correctly
-                f = open(fullpath, 'w', 0)
+                f = _open_datafile(fullpath, 'wb' if binary else 'w')
                 _write_conf(f, formats, extra_base='sweep_options', async=async, reset=reset, start=start, stop=stop, updown=updown)
-                writevec(f, hdrs+['time'], pre_str='#')
+                _write_header_row(f, file_hdrs, binary)
                 if fullpathrev != None:
-                    frev = open(fullpathrev, 'w', 0)
+                    frev = _open_datafile(fullpathrev, 'wb' if binary else 'w')
                     _write_conf(frev, formatsrev, extra_base='sweep_options', async=async, reset=reset, start=start, stop=stop, updown=updown)
-                    writevec(frev, hdrs+['time'], pre_str='#')
+                    _write_header_row(frev, file_hdrs, binary)
                 else:
                     frev = f
             ###############################
             # Start of loop
             ###############################
+            # t is passed as a default parameter because it is deleted at the end.
+            def output_point(cf, row, iv, vals, t=(t if graph else None)):
+                if cf:
+                    _write_row(cf, row, binary)
+                    if tm:
+                        tm.mark('write')
+                if graph:
+                    if logspace and negative:
+                        t.addPoint(-iv, gsel([-iv]+vals))
+                    else:
+                        t.addPoint(iv, gsel([iv]+vals))
+                    if tm:
+                        tm.mark('graph')
+                    _checkTracePause(t)
+                    if tm:
+                        tm.mark('pause')
             cycle_list = [(fwd, f, formats)]
             ioffset = 0
             if updown == True:
@@ -836,43 +1253,85 @@ class _Sweep(instruments.BaseInstrument):
                 cycle_span = span
                 if not cfwd: # doing reverse
                     cycle_span = span[::-1]
+                if list_sweep:
+                    times, all_vals = self._list_sweep_run(dev, cycle_span, devs, tm)
+                    for iv, vals, tme in zip(cycle_span, all_vals, times):
+                        output_point(cf, [iv]+vals+[tme], iv, vals)
+                        if graph and t.abort_enabled:
+                            break
+                    if updown_same:
+                        ioffset += len(cycle_span)
+                    if graph and t.abort_enabled:
+                        break
+                    continue
                 for i,v in enumerate(cycle_span):
                     i += ioffset
+                    if tm:
+                        tm.new_point()
                     tme = clock.get()
                     dev.set(v, **dev_opt) # TODO replace with move
+                    set_time = time.time()
                     iv = dev.getcache() # in case the instrument changed the value
+                    if tm:
+                        tm.mark('set')
+                    if pending is not None:
+                        # save and show the previous point while the new one settles.
+                        p = pending
+                        pending = None
+                        output_point(*p)
+                        if graph and t.abort_enabled:
+                            break
                     self.execbefore(i, v, cfwd)
-                    wait(self.beforewait.get())
+                    if tm:
+                        tm.mark('before')
+                    if pipeline:
+                        # beforewait is counted from the set
+                        bwait = self.beforewait.get() - (time.time() - set_time)
+                        if bwait > 0:
+                            wait(bwait)
+                    else:
+                        wait(self.beforewait.get())
                     if i == 0 and cfwd and first_wait != None:
                         wait(first_wait)
+                    if tm:
+                        tm.mark('wait')
                     if async:
-                        vals = _readall_async(devs, cformats, i)
+                        vals = _readall_async(devs, cformats, i, timing=tm)
                     else:
-                        vals = _readall(devs, cformats, i)
+                        vals = _readall(devs, cformats, i, timing=tm)
                     self.execafter(i, v, cfwd, [iv]+vals+[tme])
-                    if cf:
-                        writevec(cf, [iv]+vals+[tme])
-                    if graph:
-                        if logspace and negative:
-                            t.addPoint(-iv, gsel([-iv]+vals))
-                        else:
-                            t.addPoint(iv, gsel([iv]+vals))
-                        _checkTracePause(t)
-                        if t.abort_enabled:
-                            break
+                    if tm:
+                        tm.mark('after')
+                    row = [iv]+vals+[tme]+[tm.get(c) for c in timing_cols]
+                    if pipeline:
+                        pending = (cf, row, iv, vals)
+                        continue
+                    output_point(cf, row, iv, vals)
+                    if graph and t.abort_enabled:
+                        break
                 if updown_same:
                     ioffset = i + 1
                 if graph:
                     if t.abort_enabled:
                         break
+            if pending is not None:
+                p = pending
+                pending = None
+                output_point(*p)
         except KeyboardInterrupt:
             (exc_type, exc_value, exc_traceback) = sys.exc_info()
             raise KeyboardInterrupt('Interrupted sweep'), None, exc_traceback
         finally:
+            if pending is not None and pending[0]:
+                # make sure the last point read is saved.
+                _write_row(pending[0], pending[1], binary)
             if f:
                 f.close()
             if fullpathrev != None and frev:
                 frev.close()
+            if tm:
+                tm.end_point()
+                tm.summary()
         if graph and t.abort_enabled:
             raise KeyboardInterrupt('Aborted sweep')
         if isinstance(reset, bool):
@@ -889,6 +1348,170 @@ class _Sweep(instruments.BaseInstrument):
             t = t.destroy()
             del t
 
+    def nested(self, levels, filename='%T.txt', out=None, snake=False,
+               close_after=False, title=None, extra_conf=None, async=False,
+               reset=False, first_wait=None, line_wait=None, binary=False):
+        """
+            Usage:
+                levels is a list of sweep definitions, the outermost first and
+                       the innermost (fastest changing) last.
+                       Every element is either (dev, start, stop, npts)
+                       or (dev, list_of_values). dev can be a (dev, dict) tuple
+                       like for sweep.
+                All the points are saved in a single file (one row per point,
+                the columns being all the levels values followed by the out devices
+                values and the time). The headers are collected only once and
+                a single graph is used (it is cleared at the start of every inner line).
+                snake: when True, the levels are swept back and forth
+                       (the inner sweep reverses direction on every line) instead
+                       of returning to their first value. This avoids the large jumps
+                       at the start of every line.
+                first_wait: extra wait time in seconds after setting the first point.
+                line_wait: extra wait time in seconds every time one of the outer
+                           levels changes value (at the start of every inner line).
+                reset: When True, all the levels are returned to their first value
+                       at the end. When False (default) the last values are kept.
+                filename, close_after, title, out, extra_conf, async, binary: see sweep.
+                  For filename {start}, {stop}, {npts} refer to the inner level with
+                  npts the total number of points.
+                The variables i, v and fwd for the before and after devices
+                are the global point index, the inner value and the inner direction.
+            Example:
+                sweep.nested([(yo1, -1, 1, 21), (yo2, 0, 1, 101)], out=dmm1, snake=True)
+        """
+        if len(levels) < 1:
+            raise ValueError, 'Need at least one level to sweep'
+        devs_orig = []
+        devs_kw = []
+        spans = []
+        for lvl in levels:
+            if len(lvl) == 4:
+                dev_orig, start, stop, npts = lvl
+                npts = int(npts)
+                if npts < 1:
+                    raise ValueError, 'npts needs to be at least 1'
+                span = np.linspace(start, stop, npts)
+            elif len(lvl) == 2:
+                dev_orig, span = lvl
+                span = np.asarray(span)
+            else:
+                raise ValueError, 'Every level needs to be (dev, start, stop, npts) or (dev, list_of_values)'
+            dev, dev_opt = _get_dev_kw(dev_orig)
+            try:
+                dev.check(np.min(span), **dev_opt)
+                dev.check(np.max(span), **dev_opt)
+            except ValueError:
+                print 'Wrong start or stop values (outside of valid range) for %s. Aborting!'%dev.getfullname()
+                return
+            if instruments_base.CHECKING:
+                # For checking only take first and last values
+                span = span[[0,-1]]
+            devs_orig.append(dev_orig)
+            devs_kw.append((dev, dev_opt))
+            spans.append(span)
+        shape = [len(s) for s in spans]
+        npts = int(np.prod(shape))
+        nouter = len(levels) - 1
+        inner_span = spans[-1]
+        devs = self.get_alldevs(out)
+        fullpath = None
+        self._lastnames = []
+        if filename != None:
+            basepath = use_sweep_path(filename)
+            with self._lock_instrument:
+                # lock to protect manipulation of next_file_i across threads
+                fullpath, unique_i = _process_filename(basepath, now=time.time(), start=inner_span[0],
+                                                       stop=inner_span[-1], npts=npts, updown='')
+                self._lastnames.append(fullpath)
+            filename = os.path.basename(fullpath)
+        if extra_conf == None:
+            extra_conf = []
+        elif not isinstance(extra_conf, list):
+            extra_conf = [extra_conf]
+        else:
+            extra_conf = extra_conf[:] # make a copy so we don't change the user parameters
+        extra_conf = extra_conf + devs_orig[:-1] + [sweep.out]
+        hdrs, graphsel, formats = _getheaders(devs_orig[-1], devs, fullpath, npts, extra_conf=extra_conf)
+        outer_hdrs = [d.getfullname() for d, o in devs_kw[:-1]]
+        graph = self.graph.get()
+        if graph:
+            t = traces.Trace()
+            if title == None:
+                title = filename
+            if title == None:
+                title = str(self._sweep_trace_num)
+            self._sweep_trace_num += 1
+            t.setWindowTitle('Sweep: '+title)
+            t.setLim(inner_span)
+            if len(graphsel) == 0:
+                gsel = _itemgetter(0)
+            else:
+                gsel = _itemgetter(*graphsel)
+            t.setlegend(gsel(hdrs))
+            t.set_xlabel(hdrs[0])
+        try:
+            f = None
+            if filename != None:
+                f = _open_datafile(fullpath, 'wb' if binary else 'w')
+                _write_conf(f, formats, extra_base='sweep_options', async=async, reset=reset, snake=snake,
+                            levels=[(h, s[0], s[-1], len(s)) for h, s in zip(outer_hdrs+hdrs[:1], spans)])
+                _write_header_row(f, outer_hdrs+hdrs+['time'], binary)
+            ###############################
+            # Start of loop
+            ###############################
+            prev_idx = None
+            line_i = 0
+            for i, idx in enumerate(_nested_indices(shape, snake)):
+                tme = clock.get()
+                new_line = False
+                for j, (k, (dev, dev_opt), span) in enumerate(zip(idx, devs_kw, spans)):
+                    if prev_idx is not None and prev_idx[j] == k:
+                        continue
+                    dev.set(span[k], **dev_opt) # TODO replace with move
+                    if j < nouter:
+                        new_line = True
+                if new_line:
+                    line_i += 1
+                cfwd = not (snake and line_i%2)
+                prev_idx = idx
+                outer_vals = [dev.getcache() for dev, dev_opt in devs_kw[:-1]]
+                v = inner_span[idx[-1]]
+                iv = devs_kw[-1][0].getcache() # in case the instrument changed the value
+                if graph and new_line:
+                    t.clearPoints()
+                self.execbefore(i, v, cfwd)
+                wait(self.beforewait.get())
+                if i == 0 and first_wait != None:
+                    wait(first_wait)
+                elif new_line and line_wait != None:
+                    wait(line_wait)
+                if async:
+                    vals = _readall_async(devs, formats, i)
+                else:
+                    vals = _readall(devs, formats, i)
+                self.execafter(i, v, cfwd, outer_vals+[iv]+vals+[tme])
+                if f:
+                    _write_row(f, outer_vals+[iv]+vals+[tme], binary)
+                if graph:
+                    t.addPoint(iv, gsel([iv]+vals))
+                    _checkTracePause(t)
+                    if t.abort_enabled:
+                        break
+        except KeyboardInterrupt:
+            (exc_type, exc_value, exc_traceback) = sys.exc_info()
+            raise KeyboardInterrupt('Interrupted sweep'), None, exc_traceback
+        finally:
+            if f:
+                f.close()
+        if graph and t.abort_enabled:
+            raise KeyboardInterrupt('Aborted sweep')
+        if reset:
+            for (dev, dev_opt), span in zip(devs_kw, spans):
+                dev.set(span[0], **dev_opt)
+        if graph and close_after:
+            t = t.destroy()
+            del t
+
 sweep = _Sweep()
 
 
@@ -970,6 +1593,7 @@ class _Snap(object):
         self.async = False
         self.cycle = 0
         self.formats = None
+        self._file = None
         self._lock_instrument = instruments_base.Lock_Instruments()
         self._lock_extra = instruments_base.Lock_Extra()
     @instruments_base.locked_calling
@@ -980,6 +1604,8 @@ class _Snap(object):
         Subsequent call can have no parameters and the previously selected
         devices will be appended to the filename.
         Changing the device list, will append a new header and change the following calls.
+        The file is kept open between calls (the data is written in the background,
+        see sweep.flush_interval). Use snap.close() to close it.
         The filename uses the sweep.path directory.
         Async unset (None) will use the last one async mode (which starts at False)
         With append=True and opening an already existing file, the data is appended
@@ -1022,10 +1648,12 @@ class _Snap(object):
             self.cycle = 0
         if filename == None:
             raise ValueError, 'Snap. No filename selected'
-        if new_file:
-            f = open(filename, new_file_mode, 0)
-        else:
-            f = open(filename, 'a', 0)
+        if new_file or self._file is None:
+            self.close()
+            if not new_file:
+                new_file_mode = 'a'
+            self._file = _open_datafile(filename, new_file_mode)
+        f = self._file
         if new_out:
             hdrs, graphsel, formats = _getheaders(getdevs=out, root=filename)
             self.formats = formats
@@ -1041,7 +1669,16 @@ class _Snap(object):
             vals = _readall(out, formats, i)
         self.cycle += 1
         writevec(f, [tme]+vals)
-        f.close()
+    @instruments_base.locked_calling
+    def close(self):
+        """
+        Closes the current file (after all the data is written).
+        The next call will reopen it in append mode.
+        """
+        if self._file is not None:
+            f = self._file
+            self._file = None
+            f.close()
 
 snap = _Snap()
 
@@ -1050,7 +1687,14 @@ def _record_execafter(command, i, vals):
 
 
 _record_trace_num = 0
-def record(devs, interval=1, npoints=None, filename='%T.txt', title=None, extra_conf=None, async=False, after=None):
+def _format_ncols(fmt):
+    """ returns the number of columns used in the main file by a device """
+    if fmt['file'] != True and isinstance(fmt['multi'], list):
+        return len(fmt['multi'])
+    return 1
+
+def record(devs, interval=1, npoints=None, filename='%T.txt', title=None, extra_conf=None, async=False, after=None,
+           binary=False, timing=False, schedule=False, intervals=None):
     """
        record to filename (if not None) the values from devs
          uses sweep.path
@@ -1058,7 +1702,20 @@ def record(devs, interval=1, npoints=None, filename='%T.txt', title=None, extra_
        interval is in seconds
        npoints is max number of points. If None, it will only stop
         on CTRL-C...
-       filename, title, extra_conf and async behave the same way as for sweep.
+       schedule: When False (default), interval is the wait time between the end
+                 of the reads and the start of the next ones. So the real period
+                 is longer than interval and will vary.
+                 When True, the reads start at fixed times (start+n*interval)
+                 so there is no drift. When the reads take too long, some ticks
+                 are skipped and reported (missed deadlines). interval needs
+                 to be > 0.
+       intervals: a list (one per device in devs) of intervals in seconds.
+                  It allows the devices to be read at different rates. The values
+                  are rounded to multiples of interval (the tick period).
+                  On every tick only the devices that are due are read, the
+                  other columns are filled with nan.
+                  Using intervals enables schedule.
+       filename, title, extra_conf, async, binary and timing behave the same way as for sweep.
        However filename will not handle the {start}, {stop}, {npts}, {updown} options.
 
        after is a string to be executed after every iteration.
@@ -1070,10 +1727,12 @@ def record(devs, interval=1, npoints=None, filename='%T.txt', title=None, extra_
        the device (and respond faster) you can obtain the cache value with
        dev.getcache()
     """
-    global _record_trace_num
+    global _record_trace_num, _last_timing
     # make sure devs is list like
     if not isinstance(devs, list):
         devs = [devs]
+    if (schedule or intervals is not None) and interval <= 0:
+        raise ValueError, 'interval (the tick period) needs to be > 0 with schedule or intervals'
     t = traces.Trace(time_mode=True)
     fullpath = None
     if filename != None:
@@ -1093,37 +1752,110 @@ def record(devs, interval=1, npoints=None, filename='%T.txt', title=None, extra_
         graphsel=[0]
     gsel = _itemgetter(*graphsel)
     t.setlegend(gsel(hdrs))
+    timing_cols = []
+    tm = None
+    if timing:
+        tm = _last_timing = _PhaseTiming()
+        if timing == 'columns':
+            timing_cols = _timing_columns(devs)[2:] # no set and wait
+    mults = None
+    if intervals is not None:
+        schedule = True
+        if not isinstance(intervals, (list, tuple)):
+            intervals = [intervals]*len(devs)
+        if len(intervals) != len(devs):
+            raise ValueError, 'intervals needs to have the same number of elements as devs'
+        mults = [max(1, int(round(iv/float(interval)))) for iv in intervals]
+        for dev, iv, m in zip(devs, intervals, mults):
+            if abs(m*interval - iv) > 1e-6*interval:
+                print 'Warning: interval of %s is rounded to %r s'%(_get_dev_kw(dev)[0].getfullname(), m*interval)
+        ncols = [_format_ncols(fmt) for fmt in formats[:len(devs)]]
+        next_due = [0]*len(devs)
+    missed = 0
     try:
         f = None
         if filename != None:
-            # Make it unbuffered, windows does not handle line buffer correctly
-            f = open(fullpath, 'w', 0)
-            _write_conf(f, formats, extra_base='record options', async=async, interval=interval)
-            writevec(f, ['time']+hdrs, pre_str='#')
+            f = _open_datafile(fullpath, 'wb' if binary else 'w')
+            _write_conf(f, formats, extra_base='record options', async=async, interval=interval,
+                        schedule=schedule, intervals=intervals)
+            _write_header_row(f, ['time']+hdrs+['timing '+c for c in timing_cols], binary)
         i=0
+        tick = 0
+        t0 = time.time()
         while npoints == None or i < npoints:
+            if tm:
+                tm.new_point()
             tme = clock.get()
+            if mults is None:
+                sel_devs = devs
+                sel_formats = formats
+            else:
+                sel = [k for k in range(len(devs)) if tick >= next_due[k]]
+                sel_devs = [devs[k] for k in sel]
+                sel_formats = [formats[k] for k in sel]
             if async:
-                vals = _readall_async(devs, formats, i)
+                vals = _readall_async(sel_devs, sel_formats, i, timing=tm)
             else:
-                vals = _readall(devs, formats, i)
+                vals = _readall(sel_devs, sel_formats, i, timing=tm)
+            if mults is not None:
+                # fill in the devices not read on this tick
+                sel_vals = vals
+                vals = []
+                j = 0
+                for k in range(len(devs)):
+                    if k in sel:
+                        vals.extend(sel_vals[j:j+ncols[k]])
+                        j += ncols[k]
+                        next_due[k] = (tick//mults[k] + 1)*mults[k]
+                    else:
+                        vals.extend([np.nan]*ncols[k])
             if after != None:
                 _record_execafter(after, i, [tme]+vals)
+                if tm:
+                    tm.mark('after')
             t.addPoint(tme, gsel(vals))
+            if tm:
+                tm.mark('graph')
             if f:
-                writevec(f, [tme]+vals)
+                _write_row(f, [tme]+vals+[tm.get(c) for c in timing_cols], binary)
+                if tm:
+                    tm.mark('write')
             if t.abort_enabled:
                 break
             i += 1
             if npoints == None or i < npoints:
-                wait(interval)
+                if schedule:
+                    tick += 1
+                    now = time.time()
+                    skip = int((now - (t0 + tick*interval))/interval)
+                    if skip > 0:
+                        missed += skip
+                        print 'record: missed %i tick(s) before point %i'%(skip, i)
+                        tick += skip
+                    wait(t0 + tick*interval - now)
+                else:
+                    wait(interval)
+                if tm:
+                    tm.mark('wait')
+            if schedule and t.pause_enabled:
+                # don't count the pause as missed ticks
+                pause_start = time.time()
+                _checkTracePause(t)
+                t0 += time.time() - pause_start
             _checkTracePause(t)
+            if tm:
+                tm.mark('pause')
     except KeyboardInterrupt:
         (exc_type, exc_value, exc_traceback) = sys.exc_info()
         raise KeyboardInterrupt('Interrupted record'), None, exc_traceback
     finally:
         if f:
             f.close()
+        if missed:
+            print 'record: a total of %i tick(s) were missed'%missed
+        if tm:
+            tm.end_point()
+            tm.summary()
     if t.abort_enabled:
         raise KeyboardInterrupt('Aborted record')
 
@@ -1349,8 +2081,17 @@ def iprint(instrument, force=False):
        Prints the value of all the device inside instrument.
        If force is True, use get instead of getcache for
        all autoinit devices.
+       instrument can also be a list of instruments. With force, they are
+       then reread in parallel.
     """
-    print instrument.iprint(force=force)
+    if not isinstance(instrument, (list, tuple)):
+        print instrument.iprint(force=force)
+        return
+    if force:
+        instruments_base._parallel_calls([(instr, instr.force_get) for instr in instrument])
+    for instr in instrument:
+        print '==== %s ===='%instr.find_global_name()
+        print instr.iprint()
 
 def ilist():
     """
@@ -1469,8 +2210,60 @@ def _load_helper(entry):
     else:
         raise ValueError('The load_config conf entry (%s) is not in an acceptable format'%entry)
 
+def _load_key(param, name):
+    # The jobs with the same key are done one after the other (same instrument/port)
+    if len(param) == 0:
+        return 'noaddr-'+name
+    return _visa_addr_key(param[0])
+
+def _run_parallel_jobs(jobs, fail_fast=False):
+    """
+    jobs is a list of (key, func). The funcs with the same key are
+    called one after the other (in order), in a thread per key.
+    Returns a list of (ok, result or exc_info, duration) in the jobs order.
+    With fail_fast, after the first exception no new job is started (the
+    jobs already running are waited for) and the skipped jobs are None
+    in the returned list.
+    """
+    results = [None]*len(jobs)
+    groups = {}
+    order = []
+    for i, (key, func) in enumerate(jobs):
+        if key not in groups:
+            groups[key] = []
+            order.append(key)
+        groups[key].append(i)
+    changed = instruments_base.FastEvent()
+    state = dict(failed=False, running=len(order))
+    lock = threading.Lock()
+    def worker(indices):
+        try:
+            for i in indices:
+                if fail_fast and state['failed']:
+                    break
+                t0 = time.time()
+                try:
+                    results[i] = (True, jobs[i][1](), time.time()-t0)
+                except Exception:
+                    results[i] = (False, sys.exc_info(), time.time()-t0)
+                    state['failed'] = True
+        finally:
+            with lock:
+                state['running'] -= 1
+            changed.set()
+    for key in order:
+        th = threading.Thread(target=worker, args=(groups[key],), name='pyHegel load %s'%key)
+        th.daemon = True
+        th.start()
+    while True:
+        changed.clear()
+        if state['running'] <= 0:
+            break
+        instruments_base.wait_on_event(changed)
+    return results
+
 # overrides pylab load (which is no longer implemented anyway)
-def load(names=None, newnames=None):
+def load(names=None, newnames=None, parallel=False, fail_fast=False):
     """
        Uses definitions in local_config to open devices by their
        standard names. By default it produces a variable with that
@@ -1497,6 +2290,14 @@ def load(names=None, newnames=None):
        The class names are showed when running load without arguments.
        For GPIB address you can enter just the address as an integer or the
        full visa name like those returned from find_all_instruments()
+
+       parallel: when True, the instruments are opened and initialized at the
+                 same time (one thread per instrument address) and the load time
+                 of each one is shown. The instruments that loaded correctly are
+                 always created; then the first error (if any) is raised.
+       fail_fast: only for parallel. When True, after the first error no other
+                 instrument is started (they are skipped). The ones already
+                 loading are still waited for and created.
     """
     if names == None or (isinstance(names, basestring) and names == ''):
         for name, entry in sorted(local_config.conf.items()):
@@ -1515,6 +2316,33 @@ def load(names=None, newnames=None):
         newnames = [None]
     if len(newnames) < len(names):
         newnames = newnames + [None]*(len(names)-len(newnames))
+    if parallel:
+        jobs = []
+        for name in names:
+            instr, param, kwargs = _load_helper(local_config.conf[name])
+            func = lambda instr=instr, param=param, kwargs=kwargs: instr(*param, **kwargs)
+            jobs.append((_load_key(param, name), func))
+        t0 = time.time()
+        results = _run_parallel_jobs(jobs, fail_fast)
+        error = None
+        for name, newname, result in zip(names, newnames, results):
+            if newname == None:
+                newname = name
+            if result is None:
+                print '  Skipped: %6s'%newname
+                continue
+            ok, res, dt = result
+            if ok:
+                _globaldict[newname] = res
+                print '  Loaded: %6s   (%.2f s)'%(newname, dt)
+            else:
+                print '  Failed: %6s   (%.2f s) %s: %s'%(newname, dt, res[0].__name__, res[1])
+                if error is None:
+                    error = res
+        print '  Total load time: %.2f s'%(time.time()-t0)
+        if error is not None:
+            raise error[0], error[1], error[2]
+        return
     for name, newname in zip(names, newnames):
         instr, param, kwargs = _load_helper(local_config.conf[name])
         if newname == None:
@@ -1523,11 +2351,12 @@ def load(names=None, newnames=None):
         _globaldict[newname] = i
         #exec 'global '+newname+';'+newname+'=i'
 
-def load_all_usb():
+def load_all_usb(parallel=False, fail_fast=False):
     """
      This will load all USB instruments found with find_all_instruments
      that exist in load. They need to be defined with a full name (USB::1234::5677...)
      and not an alias.
+     parallel, fail_fast: see load
     """
     found_instr = find_all_instruments(False)
     found_usb = [_normalize_usb(instr) for instr in found_instr if instr.upper().startswith('USB')]
@@ -1536,9 +2365,13 @@ def load_all_usb():
     usb_instr = { _normalize_usb(para[0])[0]:name
                     for name, para in conf_norm.iteritems()
                     if len(para)>0 and isinstance(para[0], basestring) and para[0].upper().startswith('USB')}
+    to_load = []
     for usb, manuf, model in found_usb:
         try:
             name = usb_instr[usb]
+            if parallel:
+                to_load.append(name)
+                continue
             load(name)
             print '  Loaded: %6s   (%s)'%(name, usb)
         except KeyError:
@@ -1552,8 +2385,10 @@ def load_all_usb():
             else:
                 extra = ', instruments class=%s'%instr_class.__name__
             print '  Unknown instrument: %s (guess manuf=%s, model=%s%s)'%(usb, guess_manuf, guess_model, extra)
+    if to_load:
+        load(to_load, parallel=True, fail_fast=fail_fast)
 
-def load_all_gpib(all_ids=True):
+def load_all_gpib(all_ids=True, parallel=False, fail_fast=False):
     """
      This will load all GPIB instruments found with find_all_instruments
      that exist in load and for which the idn is accepted. They need to be
@@ -1562,6 +2397,13 @@ def load_all_gpib(all_ids=True):
               ids. When false, only communicates with devices having a possible
               address match in local_config. However, the missing entry will
               less descriptive (will not show the id).
+              The ids of the addresses in the discovery cache (see idn_cache)
+              are only checked with a bare *idn? query.
+     parallel: when True, every address is identified and loaded in its own
+               thread, and the time taken for each one is shown.
+     fail_fast: only for parallel. After the first error, the addresses not
+               started yet are skipped (otherwise, all the addresses are tried).
+               The first error is raised at the end.
     """
     def check(instr):
         if isinstance(instr, basestring) and instr.upper().startswith('GPIB'):
@@ -1576,37 +2418,77 @@ def load_all_gpib(all_ids=True):
     gpib_instr = { name: (para[0], _normalize_gpib(para[1][0]))
                     for name, para in conf_norm.iteritems()
                     if len(para[1]) >= 1 and check(para[1][0])}
-    for instr in found_gpib:
+    def handle(instr):
+        # returns the messages to show
         if all_ids:
-            idns = _get_visa_idns(instr)
+            idns = _get_visa_idns_cached(instr)
             id = (idns['vendor'], idns['model'], idns['firmware'])
         else:
             idns = None
         correct_addr = {name: para for name, para in gpib_instr.iteritems()
                             if para[1] == instr}
-        not_found = True
         if len(correct_addr):
             if not all_ids:
-                idns = _get_visa_idns(instr)
+                idns = _get_visa_idns_cached(instr)
                 id = (idns['vendor'], idns['model'], idns['firmware'])
             for name, para in correct_addr.iteritems():
                 if instruments_registry.check_instr_id(para[0], id):
                     load(name)
-                    print '  Loaded: %6s   (%s)'%(name, instr)
-                    not_found = False
-                    break
-        if not_found:
-            if idns is not None:
-                extra=''
-                try:
-                    instr_class = instruments_registry.find_instr(id)
-                except KeyError:
-                    pass
-                else:
-                    extra = ', instruments class=%s'%instr_class.__name__
-                print '  Unknown instrument: %s (id vendor=%s, model=%s%s)'%(instr, idns['vendor'], idns['model'], extra)
+                    return '  Loaded: %6s   (%s)'%(name, instr)
+        if idns is not None:
+            extra=''
+            try:
+                instr_class = instruments_registry.find_instr(id)
+            except KeyError:
+                pass
             else:
-                print '  Unknown instrument: %s'%(instr)
+                extra = ', instruments class=%s'%instr_class.__name__
+            return '  Unknown instrument: %s (id vendor=%s, model=%s%s)'%(instr, idns['vendor'], idns['model'], extra)
+        return '  Unknown instrument: %s'%(instr)
+    if not parallel:
+        for instr in found_gpib:
+            print handle(instr)
+        return
+    t0 = time.time()
+    jobs = [(instr, lambda instr=instr: handle(instr)) for instr in found_gpib]
+    error = None
+    for instr, result in zip(found_gpib, _run_parallel_jobs(jobs, fail_fast)):
+        if result is None:
+            print '  Skipped: %s'%instr
+            continue
+        ok, res, dt = result
+        if ok:
+            print res + '  [%.2f s]'%dt
+        else:
+            print '  Failed: %s (%.2f s) %s: %s'%(instr, dt, res[0].__name__, res[1])
+            if error is None:
+                error = res
+    print '  Total time: %.2f s'%(time.time()-t0)
+    if error is not None:
+        raise error[0], error[1], error[2]
+
+def idn_cache(clear=False, ttl=None, enable=None, show=True):
+    """
+    The idn of the instruments found on the visa addresses (and their
+    instruments class) are kept in a file in the user configuration directory
+    so that visaAutoLoader and load_all_gpib don't need to open every address
+    as a visaInstrument again in the next sessions: the known ones are only
+    checked with a *idn? on a bare visa session. The entries expire after ttl s.
+    clear:  True to forget all the entries, or an address to forget only that one.
+    ttl:    the new expiration time in s.
+    enable: True or False to turn the cache on or off.
+    show:   when True, prints the entries (the expired ones are marked with *).
+    """
+    if clear is True:
+        discovery_cache.forget()
+    elif clear is not False:
+        discovery_cache.forget(_visa_addr_key(clear))
+    if ttl is not None:
+        discovery_cache.ttl = ttl
+    if enable is not None:
+        discovery_cache.enabled = enable
+    if show:
+        discovery_cache.report()
 
 
 class _Hegel_Task(threading.Thread):
@@ -1652,6 +2534,122 @@ def task(*arg, **kwarg):
     """
     _Hegel_Task(*arg, **kwarg)
 
+def stats_enable(state=None):
+    """
+    Turns on (state=True) or off (state=False) the collection of statistics
+    (counts, time, bytes and latency histograms) of all the device gets/sets
+    and visa instrument read/write/ask. Use stats_top to see them.
+    Without a state, it returns the current one.
+    """
+    if state is None:
+        return dev_stats.enabled
+    dev_stats.enabled = state
+
+def stats_top(n=20, sort='total', per='device'):
+    """
+    Shows the statistics collected after stats_enable(True).
+    n:    the number of entries to show (None for all)
+    sort: the largest values of 'total' (time), 'count', 'mean', 'max' or
+          'bytes' are shown first.
+    per:  'device' shows every device (get/set) and instrument (read/write/ask)
+          separately. 'instrument' combines them per instrument.
+    The p90 column is an upper bound of the 90 percentile latency obtained
+    from the histogram (see dev_stats.histogram).
+    """
+    dev_stats.top(n, sort, per)
+
+def stats_reset():
+    """
+    Forgets all the statistics collected (see stats_enable).
+    """
+    dev_stats.reset()
+
+def traffic_enable(state=None, size=None):
+    """
+    Turns on (state=True) or off (state=False) the recording of the
+    instruments traffic (every write, read and ask of visa instruments and
+    of the Zurich UHF). Only the last size operations are kept (changing
+    size clears the recording). Use traffic_summary or traffic_dump to see them.
+    Without a state, it returns the current one.
+    """
+    if size is not None and size != traffic.get_size():
+        traffic.set_size(size)
+    if state is None:
+        return traffic.enabled
+    traffic.enabled = state
+
+def traffic_summary(n=20, sort='total'):
+    """
+    Shows the recorded traffic (see traffic_enable) combined per instrument,
+    operation and command (without its arguments).
+    n:    the number of entries to show (None for all)
+    sort: the largest values of 'total' (time), 'count', 'mean', 'max' or
+          'bytes' are shown first.
+    """
+    traffic.summary(n, sort)
+
+def traffic_dump(filename):
+    """
+    Writes all the recorded traffic operations (see traffic_enable) to filename,
+    one per line with their time, duration, instrument, operation, size and command.
+    """
+    traffic.dump(filename)
+
+def traffic_clear():
+    """
+    Forgets all the recorded traffic (see traffic_enable).
+    """
+    traffic.clear()
+
+def header_cache(max_age=None, clear=False):
+    """
+    The configuration headers (instruments _current_config) saved in the
+    files of sweep, record, get(filename=...) ... can be reused for max_age s
+    instead of querying the instruments every time. A set of any of the
+    devices of an instrument forces a new query. Changes done on the
+    instrument front panel are not detected, so keep max_age short
+    (0 disables the cache, which is the default).
+    clear: when True, forgets all the cached headers.
+    Without a max_age, it returns the current one.
+    """
+    if clear:
+        instruments_base._conf_cache_clear()
+    if max_age is None:
+        return instruments_base.conf_cache_max_age
+    instruments_base.conf_cache_max_age = max_age
+
+def cache_memory(threshold=None, budget=None, policy=None):
+    """
+    Controls the memory used by the device caches for large values
+    (numpy arrays like the fetch of scopes, network analyzers ...)
+    threshold: values larger than this (in bytes) are large.
+    budget:    the maximum total (in bytes) of large values kept by all the
+               devices. The oldest ones are dropped first. Use 0 to keep none,
+               or -1 to remove the limit.
+    policy:    the default policy ('keep', 'weak', 'drop' or 'write') for
+               the devices that don't have one (see BaseDevice.set_cache_policy).
+    Without any parameter, it returns the current (threshold, budget, policy).
+    Use cache_report to see what is kept.
+    """
+    if threshold is None and budget is None and policy is None:
+        return (instruments_base.cache_large_threshold, instruments_base.cache_budget,
+                instruments_base.cache_default_policy)
+    if policy is not None:
+        if policy not in instruments_base._cache_policies:
+            raise ValueError('Invalid cache policy. Use one of %r'%instruments_base._cache_policies)
+        instruments_base.cache_default_policy = policy
+    if threshold is not None:
+        instruments_base.cache_large_threshold = threshold
+    if budget is not None:
+        instruments_base.cache_budget = None if budget < 0 else budget
+
+def cache_report(n=None):
+    """
+    Shows the devices keeping large values in their cache (the largest first,
+    n of them or all) and the total memory they use. See cache_memory.
+    """
+    instruments_base.cache_report(n)
+
 def top(all=False):
     """ lists the pyHegel tasks. The first number is the one you
         can use to kill the task.
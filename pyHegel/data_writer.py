@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+########################## Copyrights and license ############################
+#                                                                            #
+# Copyright 2011-2015  Christian Lupien <christian.lupien@usherbrooke.ca>    #
+#                                                                            #
+# This file is part of pyHegel.  http://github.com/lupien/pyHegel            #
+#                                                                            #
+# pyHegel is free software: you can redistribute it and/or modify it under   #
+# the terms of the GNU Lesser General Public License as published by the     #
+# Free Software Foundation, either version 3 of the License, or (at your     #
+# option) any later version.                                                 #
+#                                                                            #
+# pyHegel is distributed in the hope that it will be useful, but WITHOUT     #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or      #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public        #
+# License for more details.                                                  #
+#                                                                            #
+# You should have received a copy of the GNU Lesser General Public License   #
+# along with pyHegel.  If not, see <http://www.gnu.org/licenses/>.           #
+#                                                                            #
+##############################################################################
+
+"""
+Background writer for data files.
+
+The data files of sweep, record and snap are written from a single
+separate thread so that slow disks (like network shares) do not stall
+the measurement loop. The data is accumulated in memory and handed to the
+writer thread in chunks (every flush_interval seconds or when flush_size
+bytes are pending). The queue to the writer thread is bounded, so if the
+disk cannot keep up, the acquisition is eventually slowed down instead of
+using up all the memory.
+
+Use it like a file:
+    f = DataFile('some_file.txt', 'w')
+    f.write('some data\\n')
+    f.close()
+close (and flush(wait=True)) only returns after all the data is on disk.
+Errors produced in the writer thread are raised on the next call.
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import Queue
+import sys
+import threading
+import time
+import weakref
+
+from .kbint_util import _delayed_signal_context_manager
+
+# default values, can be overriden for every file.
+flush_interval = 1.   # in s
+flush_size = 64*1024  # in bytes
+queue_size = 256      # number of chunks
+
+class _WriterThread(threading.Thread):
+    def __init__(self, maxsize):
+        super(_WriterThread, self).__init__(name='pyHegel data writer')
+        self.daemon = True
+        self.queue = Queue.Queue(maxsize)
+        self.files = weakref.WeakValueDictionary()
+        self.files_lock = threading.Lock()
+        self._stop = False
+    def register(self, datafile):
+        with self.files_lock:
+            self.files[id(datafile)] = datafile
+    def stop(self):
+        self._stop = True
+        self.join(1.)
+    def run(self):
+        while not self._stop:
+            try:
+                item = self.queue.get(timeout=.1)
+            except Queue.Empty:
+                item = None
+            if item is not None:
+                datafile, op, data = item
+                datafile._do_op(op, data)
+                self.queue.task_done()
+            # handle files that are idle for too long
+            with self.files_lock:
+                files = self.files.values()
+            for datafile in files:
+                datafile._check_timeout()
+            # don't keep the files alive (self.files only has weak references)
+            item = datafile = data = files = None
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = _WriterThread(queue_size)
+            _writer.start()
+        return _writer
+
+class DataFile(object):
+    """
+    File like object (write, flush, close) that performs the actual
+    writes in a background thread.
+    flush_interval (s) and flush_size (bytes) select when the pending
+    data is sent to the writer thread (the first one that is reached).
+    They default to the module values.
+    """
+    def __init__(self, filename, mode='w', flush_interval=None, flush_size=None):
+        if flush_interval is None:
+            flush_interval = globals()['flush_interval']
+        if flush_size is None:
+            flush_size = globals()['flush_size']
+        self.name = filename
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        # open here so errors (bad path ...) are produced immediately
+        self._file = open(filename, mode)
+        self._pending = []
+        self._pending_size = 0
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+        self._order_lock = threading.Lock()
+        self._done = threading.Event()
+        self._done.set()
+        self._outstanding = 0
+        self._error = None
+        self.closed = False
+        self._writer = _get_writer()
+        self._writer.register(self)
+    def __repr__(self):
+        return '<DataFile %r, mode %r>'%(self.name, self.mode)
+    def __enter__(self):
+        return self
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+    def _check_error(self):
+        err = self._error
+        if err is not None:
+            self._error = None
+            raise err[0], err[1], err[2]
+    # These are called from the writer thread.
+    def _do_op(self, op, data):
+        try:
+            if self._error is None:
+                if op == 'write':
+                    self._file.write(data)
+                    self._file.flush()
+                elif op == 'close':
+                    self._file.close()
+        except:
+            self._error = sys.exc_info()
+        finally:
+            with self._lock:
+                self._outstanding -= 1
+                if self._outstanding == 0:
+                    self._done.set()
+    def _check_timeout(self):
+        if not self._pending or self.closed:
+            return
+        if time.time() - self._last_flush < self.flush_interval:
+            return
+        # Skip it if the user thread is sending data, or if data for this file
+        # is still in the queue (that data needs to be written first).
+        if not self._order_lock.acquire(False):
+            return
+        try:
+            if self._outstanding != 0:
+                return
+            data = self._take_pending()
+            if data:
+                with self._lock:
+                    self._outstanding += 1
+                    self._done.clear()
+                self._do_op('write', data)
+        finally:
+            self._order_lock.release()
+    # These are called from the user thread.
+    def _take_pending(self):
+        with self._lock:
+            data = ''.join(self._pending)
+            self._pending = []
+            self._pending_size = 0
+            self._last_flush = time.time()
+        return data
+    def _submit(self, op, data=None):
+        with self._lock:
+            self._outstanding += 1
+            self._done.clear()
+        item = (self, op, data)
+        # A CTRL-C is delayed until the data is queued, so it is not lost.
+        with _delayed_signal_context_manager():
+            while True:
+                try:
+                    self._writer.queue.put(item, timeout=.1)
+                    break
+                except Queue.Full:
+                    if not self._writer.is_alive():
+                        self._writer = _get_writer()
+                        self._writer.register(self)
+    def _send_pending(self, close=False):
+        with self._order_lock:
+            data = self._take_pending()
+            if data:
+                self._submit('write', data)
+            if close:
+                self._submit('close')
+    def write(self, s):
+        if self.closed:
+            raise ValueError, 'I/O operation on closed DataFile'
+        self._check_error()
+        with self._lock:
+            self._pending.append(s)
+            self._pending_size += len(s)
+            do_flush = self._pending_size >= self.flush_size or \
+                        time.time() - self._last_flush >= self.flush_interval
+        if do_flush:
+            self.flush()
+    def flush(self, wait=False):
+        """
+        Sends the pending data to the writer thread.
+        With wait=True, it also waits for the data to be written.
+        """
+        self._send_pending()
+        if wait:
+            self._wait()
+        self._check_error()
+    def _wait(self):
+        while not self._done.wait(.1):
+            if not self._writer.is_alive():
+                break
+    def close(self):
+        """
+        Sends all the pending data, closes the file and waits for
+        it to complete. A CTRL-C during this is delayed until the
+        file is completed, so no data is lost.
+        """
+        if self.closed:
+            return
+        with _delayed_signal_context_manager():
+            self._send_pending(close=True)
+            self.closed = True
+            self._wait()
+        self._check_error()
+
+def flush_all():
+    """
+    Sends all the pending data of all the opened DataFile and waits for it
+    to be written. This is called automatically when python exits.
+    """
+    writer = _writer
+    if writer is None:
+        return
+    with writer.files_lock:
+        files = writer.files.values()
+    for datafile in files:
+        if not datafile.closed:
+            datafile.flush(wait=True)
+
+def _shutdown():
+    flush_all()
+    if _writer is not None:
+        _writer.stop()
+
+atexit.register(_shutdown)
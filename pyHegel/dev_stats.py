@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+########################## Copyrights and license ############################
+#                                                                            #
+# Copyright 2011-2015  Christian Lupien <christian.lupien@usherbrooke.ca>    #
+#                                                                            #
+# This file is part of pyHegel.  http://github.com/lupien/pyHegel            #
+#                                                                            #
+# pyHegel is free software: you can redistribute it and/or modify it under   #
+# the terms of the GNU Lesser General Public License as published by the     #
+# Free Software Foundation, either version 3 of the License, or (at your     #
+# option) any later version.                                                 #
+#                                                                            #
+# pyHegel is distributed in the hope that it will be useful, but WITHOUT     #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or      #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public        #
+# License for more details.                                                  #
+#                                                                            #
+# You should have received a copy of the GNU Lesser General Public License   #
+# along with pyHegel.  If not, see <http://www.gnu.org/licenses/>.           #
+#                                                                            #
+##############################################################################
+
+"""
+Counters and latency histograms for devices (get/set) and instruments
+(read/write/ask).
+
+It is disabled by default (enabled=False) and then costs only a test per
+operation. Use the pyHegel commands stats_enable, stats_top and stats_reset.
+"""
+
+from __future__ import absolute_import
+
+import bisect
+import threading
+import weakref
+
+enabled = False
+
+# upper edges (s) of the latency histogram bins. There is an extra
+# bin for the larger values.
+hist_edges = [10e-6, 30e-6, 100e-6, 300e-6, 1e-3, 3e-3, 10e-3, 30e-3, .1, .3, 1., 3., 10.]
+
+class OpStats(object):
+    """ The statistics of one operation of one object """
+    def __init__(self):
+        self.reset()
+    def reset(self):
+        self.count = 0
+        self.total = 0.
+        self.min = None
+        self.max = 0.
+        self.nbytes = 0
+        self.hist = [0]*(len(hist_edges)+1)
+    def add(self, dt, nbytes=0):
+        self.count += 1
+        self.total += dt
+        if self.min is None or dt < self.min:
+            self.min = dt
+        if dt > self.max:
+            self.max = dt
+        self.nbytes += nbytes
+        self.hist[bisect.bisect_left(hist_edges, dt)] += 1
+    def mean(self):
+        if self.count == 0:
+            return 0.
+        return self.total/self.count
+    def percentile(self, p):
+        """
+        Returns the upper edge of the histogram bin containing the p
+        percentile (0-100). For the last bin it returns max.
+        """
+        if self.count == 0:
+            return 0.
+        target = self.count*p/100.
+        cum = 0
+        for i, n in enumerate(self.hist):
+            cum += n
+            if cum >= target:
+                if i < len(hist_edges):
+                    return min(hist_edges[i], self.max)
+                break
+        return self.max
+
+# obj -> {op: OpStats}
+_stats = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+def record(obj, op, dt, nbytes=0):
+    """ Adds an operation op (like 'get') of obj that took dt s """
+    with _lock:
+        d = _stats.get(obj)
+        if d is None:
+            d = _stats[obj] = {}
+        st = d.get(op)
+        if st is None:
+            st = d[op] = OpStats()
+        st.add(dt, nbytes)
+
+def reset():
+    with _lock:
+        _stats.clear()
+
+def _instrument_of(obj):
+    """
+    Returns the weakref.proxy of the instrument of obj. It is the same
+    object for all the devices of an instrument and for the instrument itself.
+    """
+    instr = getattr(obj, 'instr', None)
+    if instr is None:
+        # obj is an instrument (or a device without one)
+        instr = obj
+    if not isinstance(instr, weakref.ProxyTypes):
+        instr = weakref.proxy(instr)
+    return instr
+
+def _name(obj):
+    # instruments first: one with an alias would return the device name for getfullname
+    try:
+        return obj.find_global_name()
+    except AttributeError:
+        pass
+    try:
+        return obj.getfullname()
+    except AttributeError:
+        return repr(obj)
+
+def collect(per='device'):
+    """
+    Returns a list of (name, op, OpStats)
+    per can be 'device' (every device and instrument separately) or
+    'instrument' (the operations of the devices are combined with the
+    ones of their instrument).
+    """
+    with _lock:
+        items = [(obj, op, st) for obj, d in _stats.items() for op, st in d.items()]
+    if per == 'device':
+        return [(_name(obj), op, st) for obj, op, st in items]
+    if per != 'instrument':
+        raise ValueError("per should be 'device' or 'instrument'")
+    # the proxies are not hashable, so they are keyed by id
+    combined = {}
+    for obj, op, st in items:
+        instr = _instrument_of(obj)
+        key = (id(instr), op)
+        if key not in combined:
+            combined[key] = (instr, OpStats())
+        c = combined[key][1]
+        c.count += st.count
+        c.total += st.total
+        c.nbytes += st.nbytes
+        if st.min is not None and (c.min is None or st.min < c.min):
+            c.min = st.min
+        c.max = max(c.max, st.max)
+        c.hist = [a+b for a, b in zip(c.hist, st.hist)]
+    return [(_name(instr), op, st) for (i, op), (instr, st) in combined.items()]
+
+_sort_keys = dict(total=lambda st: st.total, count=lambda st: st.count,
+                  mean=lambda st: st.mean(), max=lambda st: st.max,
+                  bytes=lambda st: st.nbytes)
+
+def top(n=20, sort='total', per='device'):
+    """
+    Prints the n entries with the largest sort value, which can be
+    'total', 'count', 'mean', 'max' or 'bytes'.
+    per is 'device' or 'instrument' (see collect)
+    """
+    entries = collect(per)
+    key = _sort_keys[sort]
+    entries.sort(key=lambda e: key(e[2]), reverse=True)
+    if n is not None:
+        entries = entries[:n]
+    print '%-30s %-5s %8s %10s %9s %9s %9s %9s %10s'%('name', 'op', 'count', 'total(s)', 'mean(ms)',
+                                                     'p90(ms)', 'max(ms)', 'min(ms)', 'bytes')
+    for name, op, st in entries:
+        mn = st.min if st.min is not None else 0.
+        print '%-30s %-5s %8i %10.3f %9.3f %9.3f %9.3f %9.3f %10i'%(name[:30], op, st.count, st.total,
+                    st.mean()*1e3, st.percentile(90)*1e3, st.max*1e3, mn*1e3, st.nbytes)
+
+def histogram(obj, op='get'):
+    """
+    Returns the histogram of obj (a device or an instrument) for op
+    as a list of (upper edge in s, count). The last edge is None.
+    """
+    with _lock:
+        st = _stats.get(obj, {}).get(op)
+    if st is None:
+        return []
+    return zip(hist_edges+[None], st.hist)
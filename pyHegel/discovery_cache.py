@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+########################## Copyrights and license ############################
+#                                                                            #
+# Copyright 2011-2015  Christian Lupien <christian.lupien@usherbrooke.ca>    #
+#                                                                            #
+# This file is part of pyHegel.  http://github.com/lupien/pyHegel            #
+#                                                                            #
+# pyHegel is free software: you can redistribute it and/or modify it under   #
+# the terms of the GNU Lesser General Public License as published by the     #
+# Free Software Foundation, either version 3 of the License, or (at your     #
+# option) any later version.                                                 #
+#                                                                            #
+# pyHegel is distributed in the hope that it will be useful, but WITHOUT     #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or      #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public        #
+# License for more details.                                                  #
+#                                                                            #
+# You should have received a copy of the GNU Lesser General Public License   #
+# along with pyHegel.  If not, see <http://www.gnu.org/licenses/>.           #
+#                                                                            #
+##############################################################################
+
+
+"""
+Persistent cache of the instruments found on the visa addresses
+(address -> idn -> instruments class).
+
+visaAutoLoader and load_all_gpib use it for the instruments that were already
+identified: their idn is then only checked with a *idn? on a bare visa
+session instead of opening them with visaInstrument (which also clears them
+and installs all their devices). The entry is replaced when the instrument
+changed. The entries also expire after ttl s. The cache is saved in the user configuration directory.
+Use the pyHegel command idn_cache to show it, clear it or change ttl.
+"""
+
+from __future__ import absolute_import
+
+import json
+import os
+import threading
+import time
+
+from . import config
+
+enabled = True
+
+# in s
+ttl = 7*24*3600.
+
+# When None, uses discovery_cache.json in the user configuration directory
+filename = None
+
+_idn_keys = ('vendor', 'model', 'serial', 'firmware')
+
+# normalized visa address: dict(vendor, model, serial, firmware, cls, time)
+_entries = None
+_lock = threading.RLock()
+
+def _get_filename():
+    if filename is not None:
+        return filename
+    return os.path.join(config.get_conf_dirs()[0], 'discovery_cache.json')
+
+def _to_str(s):
+    # json returns unicode strings. The idn are ascii str everywhere else.
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    return s
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(_get_filename(), 'r') as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            data = {}
+        _entries = {_to_str(k): {_to_str(ek): _to_str(ev) for ek, ev in e.iteritems()}
+                        for k, e in data.iteritems()}
+    return _entries
+
+def _save():
+    fn = _get_filename()
+    conf_dir = os.path.dirname(fn)
+    try:
+        if conf_dir and not os.path.isdir(conf_dir):
+            os.mkdir(conf_dir, 0755)
+        # write to a temporary file first so a crash does not leave a partial file.
+        tmp = fn + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(_entries, f, indent=1, sort_keys=True)
+        if os.name == 'nt' and os.path.exists(fn):
+            # rename does not replace an existing file on windows
+            os.remove(fn)
+        os.rename(tmp, fn)
+    except (IOError, OSError, UnicodeDecodeError) as exc:
+        print 'WARNING: unable to save the discovery cache (%s): %s'%(fn, exc)
+
+def same_idn(idns1, idns2):
+    """ Returns True when both idns dict (see idn_split) are for the same instrument. """
+    return all(idns1[k] == idns2[k] for k in _idn_keys)
+
+def get(key):
+    """
+    Returns the entry of key (a normalized visa address) as a dict with
+    vendor, model, serial, firmware (like idn_split), cls (the name of the
+    instruments class or None) and time (of the identification).
+    Returns None when there is no entry, it is expired or the cache is disabled.
+    """
+    if not enabled:
+        return None
+    with _lock:
+        entry = _load().get(key)
+        if entry is None or time.time() - entry['time'] > ttl:
+            return None
+        return dict(entry)
+
+def put(key, idns, cls=None):
+    """
+    Stores the idns dict (see idn_split) of the instrument at key
+    and the name of its instruments class (cls).
+    """
+    if not enabled:
+        return
+    entry = {k: idns[k] for k in _idn_keys}
+    entry['cls'] = cls
+    entry['time'] = time.time()
+    with _lock:
+        _load()[key] = entry
+        _save()
+
+def forget(key=None):
+    """ Removes the entry for key, or all of them when key is None. """
+    with _lock:
+        entries = _load()
+        if key is None:
+            entries.clear()
+        elif key in entries:
+            del entries[key]
+        else:
+            return
+        _save()
+
+def report():
+    """ Prints all the entries (the expired ones are marked with a *). """
+    now = time.time()
+    with _lock:
+        items = sorted(_load().items())
+    print '%-35s %10s %-15s %-15s %-15s %-20s %s'%('address', 'age(h)', 'vendor', 'model', 'serial',
+                                                   'firmware', 'class')
+    for key, e in items:
+        age = (now - e['time'])/3600.
+        mark = '*' if age*3600. > ttl else ' '
+        print '%-35s %9.1f%s %-15s %-15s %-15s %-20s %s'%(key, age, mark, e['vendor'][:15], e['model'][:15],
+                                                       e['serial'][:15], e['firmware'][:20], e['cls'])
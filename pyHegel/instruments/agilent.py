@@ -27,6 +27,8 @@ import numpy as np
 import scipy
 import os.path
 
+from .. import traces
+
 from ..instruments_base import visaInstrument, visaInstrumentAsync,\
                             BaseDevice, scpiDevice, MemoryDevice, ReadvalDev,\
                             ChoiceMultiple, Choice_bool_OnOff, _repr_or_string,\
@@ -363,6 +365,39 @@ class agilent_rf_PSG(visaInstrument):
         Sets the current output phase as a zero reference.
         """
         self.write('PHASe:REFerence')
+    # List sweeps of frequency or amplitude. The TRIG OUT connector produces
+    # a pulse at every point.
+    def _list_sweep_devs(self):
+        return [self.freq_cw, self.ampl]
+    @locked_calling
+    def list_sweep_setup(self, dev, values, dwell):
+        if dev is self.freq_cw:
+            lst, mode, other = 'FREQuency', self.freq_mode, 'POWer'
+        else:
+            lst, mode, other = 'POWer', self.ampl_mode, 'FREQuency'
+        for v in values:
+            dev.check(v)
+        self.write(':LIST:TYPE LIST;:LIST:RETRace 0;:LIST:DIRection UP;:INITiate:CONTinuous 0')
+        self.write(':LIST:%s '%lst + ','.join(['%r'%float(v) for v in values]))
+        # The other list needs to have only one value so it is the same for all points
+        self.write(':LIST:%s %r'%(other, float(self.ask(':%s?'%other))))
+        self.write(':LIST:DWELl %r;:LIST:DWELl:TYPE LIST'%float(dwell))
+        self.write(':TRIGger:SOURce IMMediate;:LIST:TRIGger:SOURce IMMediate')
+        mode.set('LIST')
+        self._list_sweep_info = (dev, values[-1], len(values)*dwell)
+    def list_sweep_start(self, dev):
+        self.write(':INITiate')
+    def list_sweep_wait(self, dev):
+        d, last, duration = self._list_sweep_info
+        traces.wait(duration)
+        # bit 3 of the operation status is set while sweeping
+        while int(self.ask(':STATus:OPERation:CONDition?')) & 8:
+            traces.wait(.05)
+        if d is self.freq_cw:
+            self.freq_mode.set('CW')
+        else:
+            self.ampl_mode.set('FIXed')
+        d.set(last)
 
 
 #######################################################
@@ -673,6 +708,27 @@ class agilent_multi_34410A(visaInstrumentAsync):
         #      there seems to be some inteligent buffering going on, which is different in agilent and NI visas
         # When wait_on_event timesout, it produces the VisaIOError (VI_ERROR_TMO) exception
         #        the error code is available as VisaIOErrorInstance.error_code
+    # List acquisitions: one reading per external trigger, all fetched at the end.
+    def _list_acq_devs(self):
+        return [self.fetch, self.readval, self.fetch_all]
+    @locked_calling
+    def list_acq_arm(self, dev, npts):
+        if npts > 50000:
+            raise ValueError, self.perror('The reading memory is limited to 50000 points')
+        self._list_acq_restore = (self.trig_src.get(), self.trig_count.get(), self.sample_count.get())
+        self.trig_src.set('EXTernal')
+        self.trig_count.set(npts)
+        self.sample_count.set(1)
+        self.write('INITiate')
+    @locked_calling
+    def list_acq_fetch(self, dev, npts):
+        try:
+            return decode_float64(self.ask('FETCh?'))
+        finally:
+            src, count, sample = self._list_acq_restore
+            self.trig_src.set(src)
+            self.trig_count.set(count)
+            self.sample_count.set(sample)
 
 
 #######################################################
@@ -1362,6 +1418,8 @@ class agilent_PNAL(visaInstrumentAsync):
     the channel_list device to update pyHegel knowledge of the available
     traces (needed when trying to fetch all traces).
     """
+    # the data blocks are read in chunks directly in the result array
+    _block_streaming = True
     def init(self, full=False):
         self.write(':format REAL,64')
         self.write(':format:border swap')
@@ -31,7 +31,7 @@ from ..instruments_base import visaInstrumentAsync, visaInstrument,\
                             BaseDevice, scpiDevice, MemoryDevice, ReadvalDev,\
                             ChoiceBase, _general_check, _fromstr_helper, _tostr_helper,\
                             ChoiceStrings, ChoiceMultiple, ChoiceMultipleDep, Dict_SubDevice,\
-                            _decode_block_base, make_choice_list,\
+                            _decode_block_base, _decode_block_range, _frombuffer, make_choice_list,\
                             sleep, locked_calling
 from ..instruments_registry import register_instrument
 
@@ -463,41 +463,42 @@ class waveformdata(object):
     def __init__(self, return_only_header=False):
         self.return_only_header = return_only_header
     def __call__(self, inputstr):
-        ds =inputstr.split(',', 1) # strip DESC, TEXT, TIME, DAT1, DAT2, ALL
-        fullblock = _decode_block_base(ds[1])
-        header = WAVEDESC.from_buffer_copy(fullblock)
+        # The arrays are decoded directly from inputstr (no intermediate strings)
+        sep = inputstr.index(',') # strip DESC, TEXT, TIME, DAT1, DAT2, ALL
+        start, stop = _decode_block_range(inputstr, sep+1)
+        header = WAVEDESC.from_buffer_copy(buffer(inputstr, start, stop-start))
         if self.return_only_header:
             return header
+        def get_part(w, t=None):
+            if not w:
+                return ''
+            if start+ptr+w > stop:
+                raise IndexError, 'Missing data for decoding.'
+            if t is None:
+                return inputstr[start+ptr:start+ptr+w]
+            return _frombuffer(inputstr, t, start+ptr, start+ptr+w)
         ptr = header.WAVE_DESCRIPTOR
         w = header.USER_TEXT
-        usertext = fullblock[ptr:ptr+w]
+        usertext = get_part(w)
         ptr += w
         w = header.RES_DESC1
         if header.RES_DESC1 or header.RES_ARRAY1 or header.RES_ARRAY2 or header.RES_ARRAY3:
             raise ValueError, 'At least one reserved data arrays has non-zero size.'
         ptr += w
         w = header.TRIGTIME_ARRAY
-        trigtime = fullblock[ptr:ptr+w]
+        trigtime = get_part(w, [('trig_time', np.float64), ('time_offset', np.float64)])
         ptr += w
         w = header.RIS_TIME_ARRAY
-        ristime = fullblock[ptr:ptr+w]
+        ristime = get_part(w, np.float64)
         ptr += w
         w = header.RES_ARRAY1
         ptr += w
+        data_type = [np.int8, np.int16][header.COMM_TYPE]
         w = header.WAVE_ARRAY_1
-        data1 = fullblock[ptr:ptr+w]
+        data1 = get_part(w, data_type)
         ptr += w
         w = header.WAVE_ARRAY_2
-        data2 = fullblock[ptr:ptr+w]
-        data_type = [np.int8, np.int16][header.COMM_TYPE]
-        if data1:
-            data1 = np.fromstring(data1, data_type)
-        if data2:
-            data2 = np.fromstring(data1, data_type)
-        if trigtime:
-            trigtime = np.fromstring(trigtime, [('trig_time', np.float64), ('time_offset', np.float64)])
-        if ristime:
-            ristime = np.fromstring(ristime, np.float64)
+        data2 = get_part(w, data_type)
         return waveformdataType(header, data1, data2, trigtime, ristime, usertext)
     def tostr(self, val):
         pass
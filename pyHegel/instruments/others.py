@@ -91,6 +91,36 @@ class yokogawa_gs200(visaInstrument):
         # repr sometimes sends 0.010999999999999999
         # which the yokogawa understands as 0.010 instead of 0.011
         self.write(':source:level %.6e'%val)
+    # List sweeps use the program mode. The BNC output is set to produce a
+    # trigger at every step.
+    def _list_sweep_devs(self):
+        return [self.level]
+    @locked_calling
+    def list_sweep_setup(self, dev, values, dwell):
+        if len(values) > 10000:
+            raise ValueError, self.perror('The program mode is limited to 10000 steps')
+        if dwell < 0.1:
+            raise ValueError, self.perror('The program interval needs to be at least 0.1 s (use sweep.beforewait)')
+        for v in values:
+            self._level_check(v)
+        self.write(':PROGram:EDIT:STARt')
+        # send many steps per write to limit the number of transfers
+        n = 50
+        for i in range(0, len(values), n):
+            self.write(';'.join([':source:level %.6e'%v for v in values[i:i+n]]))
+        self.write(':PROGram:EDIT:END')
+        self.write(':PROGram:REPeat 0;:PROGram:SLOPe 0;:PROGram:INTerval %.6e;:ROUTe:BNCO TRIGger'%dwell)
+        self._list_sweep_info = (values[-1], len(values)*dwell)
+    def list_sweep_start(self, dev):
+        self.write(':PROGram:RUN')
+        self._list_sweep_end = time.time() + self._list_sweep_info[1]
+    def list_sweep_wait(self, dev):
+        left = self._list_sweep_end - time.time()
+        if left > 0:
+            traces.wait(left)
+        # make sure the last step is done.
+        self.ask('*OPC?')
+        self.level.setcache(self._list_sweep_info[0])
 
 
 #######################################################
@@ -110,6 +140,11 @@ class sr830_lia(visaInstrument):
 
     To read more than one channel at a time use readval/fetch(snap)
     Otherwise you can use x, y, t, theta
+
+    For fast acquisitions (up to 512 Hz) use the internal buffer:
+       set(sr1.buffer_rate, 512)
+       get(sr1.buffer_acq, npts=1000)
+    It stores what is selected by ch1_display and ch2_display.
     """
     # TODO setup snapsel to use the names instead of the numbers
     _snap_type = {1:'x', 2:'y', 3:'R', 4:'theta', 5:'Aux_in1', 6:'Aux_in2',
@@ -131,6 +166,105 @@ class sr830_lia(visaInstrument):
         d = self.snap._format
         d.update(multi=headers, graph=range(len(sel)))
         return BaseDevice.getformat(self.snap, sel=sel, **kwarg)
+    def buffer_start(self):
+        """
+        Starts (or continues after a pause) the filling of the internal buffer.
+        """
+        self.write('strt')
+    def buffer_pause(self):
+        """
+        Pauses the filling of the internal buffer.
+        """
+        self.write('paus')
+    def buffer_reset(self):
+        """
+        Resets the internal buffer (the data in it is lost).
+        Needs to be done before changing the buffer_rate.
+        """
+        self.write('rest')
+    def _buffer_ch_helper(self, ch):
+        if not isinstance(ch, (list, tuple)):
+            ch = [ch]
+        for c in ch:
+            if c not in [1, 2]:
+                raise ValueError, self.perror('Invalid ch, it should be 1, 2 or [1,2]')
+        return list(ch)
+    def _buffer_xaxis(self, start, npts):
+        rate = self.buffer_rate.getcache()
+        x = np.arange(start, start+npts, dtype=float)
+        if rate == 'trigger':
+            return x
+        return x/rate
+    def _buffer_fetch_getformat(self, **kwarg):
+        xaxis = kwarg.get('xaxis', True)
+        ch = self._buffer_ch_helper(kwarg.get('ch', [1,2]))
+        if xaxis:
+            multi = ['time(s)']
+        else:
+            multi = []
+        for c in ch:
+            multi.append('ch%i'%c)
+        fmt = self.buffer_fetch._format
+        fmt.update(multi=tuple(multi), graph=[], xaxis=xaxis)
+        return BaseDevice.getformat(self.buffer_fetch, **kwarg)
+    def _buffer_fetch_getdev(self, ch=[1,2], start=0, npts=None, xaxis=True):
+        """
+        Reads the data from the internal buffer using the fast binary transfer.
+        It does not start or stop the acquisition (see buffer_acq for that).
+        Options:
+         ch:    1, 2 or [1,2] (default) for the channels to read.
+         start: the index of the first point to read (default 0)
+         npts:  the number of points to read. By default (None) it reads all
+                the points available from start.
+         xaxis: when True (default), the first row is the time (in s) or
+                the point index when buffer_rate is 'trigger'.
+        The buffer contains what is selected with ch1_display and ch2_display.
+        """
+        ch = self._buffer_ch_helper(ch)
+        if npts is None:
+            npts = self.buffer_npts.get() - start
+        if npts <= 0:
+            raise ValueError, self.perror('No data available in buffer.')
+        ret = []
+        if xaxis:
+            ret.append(self._buffer_xaxis(start, npts))
+        for c in ch:
+            data = self.ask('trcb? %i,%i,%i'%(c, start, npts), raw=True)
+            ret.append(np.fromstring(data, '<f4'))
+        ret = np.asarray(ret)
+        if ret.shape[0] == 1:
+            ret = ret[0]
+        return ret
+    def _buffer_acq_getformat(self, **kwarg):
+        return self._buffer_fetch_getformat(**kwarg)
+    def _buffer_acq_getdev(self, npts=100, ch=[1,2], xaxis=True):
+        """
+        Performs a complete buffered acquisition: resets the buffer,
+        starts it, waits for npts points to be stored and reads them with the
+        fast binary transfer. The rate is set with buffer_rate (up to 512 Hz).
+        The maximum npts is 16383.
+        Options: npts (default 100), ch and xaxis (see buffer_fetch)
+        """
+        if not (1 <= npts <= 16383):
+            raise ValueError, self.perror('npts needs to be between 1 and 16383')
+        rate = self.buffer_rate.getcache()
+        self.buffer_mode.set('shot')
+        self.buffer_reset()
+        self.buffer_start()
+        try:
+            if rate != 'trigger':
+                traces.wait(npts/rate)
+            while True:
+                n = self.buffer_npts.get()
+                if n >= npts:
+                    break
+                if rate == 'trigger':
+                    traces.wait(.1)
+                else:
+                    traces.wait(min(max((npts-n)/rate, .01), .5))
+        finally:
+            self.buffer_pause()
+        return self._buffer_fetch_getdev(ch=ch, start=0, npts=npts, xaxis=xaxis)
     def auto_offset(self, ch='x'):
         """
            commands the auto offset for channel ch
@@ -144,7 +278,8 @@ class sr830_lia(visaInstrument):
         return self._conf_helper('async_delay','async_wait', 'freq', 'sens', 'srclvl', 'harm', 'phase', 'timeconstant', 'filter_slope',
                                  'sync_filter', 'reserve_mode',
                                  'offset_expand_x', 'offset_expand_y', 'offset_expand_r',
-                                 'input_conf', 'grounded_conf', 'dc_coupled_conf', 'linefilter_conf', options)
+                                 'input_conf', 'grounded_conf', 'dc_coupled_conf', 'linefilter_conf',
+                                 'ch1_display', 'ch2_display', 'buffer_rate', 'buffer_mode', 'buffer_trig_start_en', options)
     def _create_devs(self):
         self.freq = scpiDevice('freq', str_type=float, setget=True, min=0.001, max=102e3)
         sens = ChoiceIndex(make_choice_list([2,5,10], -9, -1), normalize=True)
@@ -178,6 +313,18 @@ class sr830_lia(visaInstrument):
         # b4=range change (accross 200 HZ, hysteresis), b5=indirect time constant change
         # b6=triggered, b7=unused
         self.status_byte = scpiDevice(getstr='LIAS?', str_type=int)
+        ratio = ChoiceIndex(['none', 'aux1', 'aux2'])
+        ch1_disp = ChoiceMultiple(['display', 'ratio'], [ChoiceIndex(['x', 'r', 'xn', 'aux1', 'aux2']), ratio])
+        ch2_disp = ChoiceMultiple(['display', 'ratio'], [ChoiceIndex(['y', 'theta', 'yn', 'aux3', 'aux4']), ratio])
+        self.ch1_display = scpiDevice('ddef 1,{val}', 'ddef? 1', choices=ch1_disp, doc='This is also what is stored in the buffer for ch1\n')
+        self.ch2_display = scpiDevice('ddef 2,{val}', 'ddef? 2', choices=ch2_disp, doc='This is also what is stored in the buffer for ch2\n')
+        buffer_rates = ChoiceIndex([0.0625*2**i for i in range(14)]+['trigger'])
+        self.buffer_rate = scpiDevice('srat', choices=buffer_rates, doc='Sample rate in Hz of the internal buffer. Use buffer_reset before changing it.\n')
+        self.buffer_mode = scpiDevice('send', choices=ChoiceIndex(['shot', 'loop']), doc='What to do when the buffer is full: stop (shot) or continue overwriting (loop)\n')
+        self.buffer_trig_start_en = scpiDevice('tstr', str_type=bool, doc='When True, a trigger on the rear panel starts the buffer\n')
+        self.buffer_npts = scpiDevice(getstr='spts?', str_type=int, doc='The number of points stored in the buffer\n')
+        self._devwrap('buffer_fetch', autoinit=False)
+        self._devwrap('buffer_acq', autoinit=False, trig=True)
         self._devwrap('snap', trig=True, doc="""
             This device can be called snap or fetch (they are both the same)
             This device obtains simultaneous readings from many inputs.
@@ -38,6 +38,7 @@
 from __future__ import absolute_import
 
 import numpy as np
+import time
 #import zhinst.ziPython as zi
 #import zhinst.utils as ziu
 zi = None
@@ -47,7 +48,9 @@ from ..instruments_base import BaseInstrument,\
                             BaseDevice, scpiDevice, InvalidAutoArgument,\
                             MemoryDevice, ReadvalDev,\
                             ChoiceDevDep,\
-                            sleep, locked_calling, ProxyMethod, _retry_wait, _repr_or_string
+                            sleep, locked_calling, ProxyMethod, _retry_wait, _repr_or_string,\
+                            _record_io
+from .. import dev_stats, traffic
 from ..instruments_base import ChoiceIndex as _ChoiceIndex
 from ..instruments_registry import register_instrument
 from .logical import FunctionDevice
@@ -569,6 +572,11 @@ class zurich_UHF(BaseInstrument):
 
         You can replace /dev2021/ by /{dev}/
         """
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
+        self._write_helper(command, val, src, t, sync)
+        if stats_t0 is not None:
+            _record_io(self, 'write', command, stats_t0, time.time(), 0)
+    def _write_helper(self, command, val, src, t, sync):
         command = self._conv_command(command)
         if t=='byte':
             self._zi_daq.setByte(command, val)
@@ -617,6 +625,12 @@ class zurich_UHF(BaseInstrument):
             obj.ask('/{dev}/demods/0/sample', t='sample')
             obj.ask('/{dev}/dios/0/input', t='dio')
         """
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
+        ret = self._ask_helper(question, src, t, strip_timestamp)
+        if stats_t0 is not None:
+            _record_io(self, 'ask', question, stats_t0, time.time(), getattr(ret, 'nbytes', 0))
+        return ret
+    def _ask_helper(self, question, src, t, strip_timestamp):
         question = self._conv_command(question)
         if t=='byte':
             return self._zi_daq.getByte(question)
@@ -29,18 +29,25 @@ import functools
 import ctypes
 import hashlib
 import os
+import Queue
+import collections
 import signal
+import sys
 import time
 import inspect
 import thread
 import threading
+import traceback
 import weakref
 from collections import OrderedDict  # this is a subclass of dict
-from .qt_wrap import processEvents
+from .qt_wrap import processEvents, QtCore, QtGui
 from .kbint_util import sleep, _sleep_signal_context_manager, _delayed_signal_context_manager
 
 from . import visa_wrap
 from . import instruments_registry
+from . import dev_stats
+from . import traffic
+from . import discovery_cache
 from .types import dict_improved
 
 rsrc_mngr = None
@@ -110,6 +117,11 @@ def test_gpib_srq_state(bus=0):
     """
     return rsrc_mngr.get_gpib_intfc_srq_state()
 
+def _idn_split(idn):
+    parts = idn.split(',', 4) # There could be , in serial firmware revision
+    # I also use lstrip because some device put a space after the comma.
+    return dict(vendor=parts[0], model=parts[1].lstrip(), serial=parts[2].lstrip(), firmware=parts[3].lstrip())
+
 def _repr_or_string(val):
     if isinstance(val, basestring):
         return val
@@ -139,6 +151,95 @@ def _get_conf_header_util(header, obj, options):
             header=[header]
     return header
 
+# The headers produced by the instruments _current_config are reused
+# for this many seconds (0 disables the cache). The cache of an instrument
+# is cleared by a set of any of its devices, and all of them by
+# _conf_cache_clear.
+conf_cache_max_age = 0.
+_conf_cache_generation = [0]
+
+def _conf_cache_clear(instr=None):
+    if instr is None:
+        _conf_cache_generation[0] += 1
+        return
+    cache = getattr(instr, '_conf_cache', None)
+    if cache:
+        cache.clear()
+
+# Memory policy of the large values (numpy arrays or lists, tuples, dict
+# of them) kept by the device caches (see BaseDevice.set_cache_policy).
+# Values smaller than cache_large_threshold bytes are always kept.
+# cache_default_policy is used by the devices without a policy.
+# cache_budget (bytes) limits the total of the large values kept by all
+# the devices (None for no limit), the oldest ones are dropped first.
+cache_large_threshold = 1e6
+cache_default_policy = 'keep'
+cache_budget = None
+_cache_policies = ['keep', 'weak', 'drop', 'write']
+_large_caches = collections.OrderedDict() # id(dev): (weakref to dev, nbytes)
+_large_caches_lock = threading.Lock()
+
+class _WeakCache(object):
+    """ Replaces a value in the device caches when only a weak reference is kept """
+    __slots__ = ['ref']
+    def __init__(self, val):
+        self.ref = weakref.ref(val)
+
+def _cache_nbytes(val):
+    if isinstance(val, np.ndarray):
+        return val.nbytes
+    if isinstance(val, dict):
+        val = val.values()
+    if isinstance(val, (list, tuple)):
+        return sum(v.nbytes for v in val if isinstance(v, np.ndarray))
+    return 0
+
+def _large_cache_unregister(dev):
+    with _large_caches_lock:
+        _large_caches.pop(id(dev), None)
+
+def _large_cache_register(dev, nbytes):
+    # dev is now the last one (most recent). Returns the list of devices
+    # to drop to respect cache_budget
+    drop = []
+    with _large_caches_lock:
+        _large_caches.pop(id(dev), None)
+        _large_caches[id(dev)] = (weakref.ref(dev), nbytes)
+        if cache_budget is None:
+            return drop
+        total = sum(nb for r, nb in _large_caches.itervalues())
+        for k in _large_caches.keys()[:-1]:
+            if total <= cache_budget:
+                break
+            r, nb = _large_caches.pop(k)
+            total -= nb
+            d = r()
+            if d is not None:
+                drop.append(d)
+    return drop
+
+def cache_report(n=None):
+    """
+    Prints the devices that are keeping large values (see cache_large_threshold)
+    in their cache, the largest first, with the total.
+    Returns the total number of bytes.
+    """
+    with _large_caches_lock:
+        items = [(r(), nb) for r, nb in _large_caches.itervalues()]
+    items = [(d, nb) for d, nb in items if d is not None]
+    items.sort(key=lambda x: x[1], reverse=True)
+    total = sum(nb for d, nb in items)
+    for d, nb in items[:n]:
+        try:
+            name = d.getfullname()
+        except (AttributeError, ReferenceError):
+            # repr also needs the instrument
+            name = '<%s at 0x%x>'%(d.__class__.__name__, id(d))
+        print '%-40s %8s %12.3f MB'%(name[:40], d._cache_policy or cache_default_policy, nb/1e6)
+    budget = 'no limit' if cache_budget is None else '%.3f MB'%(cache_budget/1e6)
+    print 'Total: %.3f MB (budget: %s)'%(total/1e6, budget)
+    return total
+
 # header or header() can be None, '' or False for no output
 # otherwise it can be a single string for a single line or
 #  a list of strings. Don't include the comment character or the newline.
@@ -146,7 +247,21 @@ def _get_conf_header(format):
     header = format['header']
     obj = format['obj']
     options = format['options']
-    return _get_conf_header_util(header, obj, options)
+    cache = None
+    if conf_cache_max_age > 0 and isinstance(header, ProxyMethod):
+        cache = getattr(header.instance, '_conf_cache', None)
+    if cache is None:
+        return _get_conf_header_util(header, obj, options)
+    key = (obj, repr(sorted(options.items())))
+    now = time.time()
+    entry = cache.get(key)
+    if entry is not None:
+        t, gen, ret = entry
+        if gen == _conf_cache_generation[0] and now-t < conf_cache_max_age:
+            return list(ret) if isinstance(ret, list) else ret
+    ret = _get_conf_header_util(header, obj, options)
+    cache[key] = (now, _conf_cache_generation[0], ret)
+    return list(ret) if isinstance(ret, list) else ret
 
 def _replace_ext(filename, newext=None):
     if newext == None:
@@ -175,6 +290,7 @@ def _write_dev(val, filename, format=format, first=False):
             filename = _replace_ext(filename, bin)
     f=open(filename, open_mode)
     dev._last_filename = filename
+    written = val
     header = _get_conf_header(format)
     if doheader: # if either is not None or not ''
         if header:
@@ -206,16 +322,31 @@ def _write_dev(val, filename, format=format, first=False):
             val = np.atleast_1d(val)
             np.savetxt(f, val.T, fmt='%.18g', delimiter='\t')
     f.close()
+    if not append:
+        dev._cache_written(written)
 
 
-def _retry_wait(func, timeout, delay=0.01):
+def _record_io(obj, op, cmd, t0, t1, nbytes):
+    """ Used by the instruments read/write/ask for dev_stats and traffic """
+    if dev_stats.enabled:
+        dev_stats.record(obj, op, t1-t0, nbytes)
+    if traffic.enabled and (op == 'ask' or not traffic.is_in_ask()):
+        traffic.record(obj, op, cmd, t0, t1, nbytes)
+
+def _retry_wait(func, timeout, delay=0.01, min_delay=None):
     """
     this calls func() and stops when the return value is True
     or timeout seconds have passed.
     delay is the sleep duration between attempts.
+    When min_delay is given, the first sleep is min_delay and it is doubled
+    after every attempt up to delay. This detects quick events faster
+    without looping too often on slower ones.
     """
     endtime = time.time() + timeout
     ret = False
+    if min_delay is None:
+        min_delay = delay
+    cur_delay = min_delay
     while True:
         ret = func()
         if ret:
@@ -223,8 +354,8 @@ def _retry_wait(func, timeout, delay=0.01):
         remaining = endtime - time.time()
         if remaining <= 0:
             break
-        delay = min(delay, remaining)
-        sleep(delay)
+        sleep(min(cur_delay, remaining))
+        cur_delay = min(cur_delay*2, delay)
     return ret
 
 
@@ -314,13 +445,79 @@ def locked_calling_dev(func):
     """ Same as locked_calling, but for a BaseDevice subclass. """
     return locked_calling(func, extra='.instr')
 
+# When True, _parallel_calls uses one thread per instrument.
+parallel_instruments = True
+
+def _parallel_calls(calls):
+    """
+    calls is a list of (instr, func). Every func() is called in its own thread
+    with the locks of instr held (instr can be None), so instruments on
+    independent buses are handled at the same time.
+    Returns the list of the results (in the same order). If some calls
+    raised an exception, the first one is reraised after all of them are done.
+    It falls back to calling them one after the other when parallel_instruments
+    is False, when there is only one call or when the current thread already
+    holds one of the instrument locks (the threads would deadlock).
+    """
+    instrs = [instr for instr, func in calls if instr is not None]
+    if not parallel_instruments or len(calls) < 2 or \
+            any(instr._lock_instrument.is_owned() for instr in instrs):
+        return [func() for instr, func in calls]
+    n = len(calls)
+    results = [None]*n
+    errors = [None]*n
+    dones = [FastEvent() for i in range(n)]
+    def run(i, instr, func):
+        try:
+            if instr is None:
+                results[i] = func()
+            else:
+                with instr._lock_instrument, instr._lock_extra:
+                    results[i] = func()
+        except BaseException:
+            errors[i] = sys.exc_info()
+        finally:
+            dones[i].set()
+    for i, (instr, func) in enumerate(calls):
+        th = threading.Thread(target=run, args=(i, instr, func), name='pyHegel parallel %i'%i)
+        th.daemon = True
+        th.start()
+    for done in dones:
+        wait_on_event(done)
+    for err in errors:
+        if err is not None:
+            raise err[0], err[1], err[2]
+    return results
+
 
 # Taken from python threading 2.7.2
 class FastEvent(threading._Event):
+    """
+    Event with a faster wait (see FastCondition).
+    It also accepts wakers: functions called (in the thread doing the set)
+    when the event is set. They are used by wait_on_event to stop
+    waiting immediately.
+    """
     def __init__(self, verbose=None):
         threading._Verbose.__init__(self, verbose)
         self._Event__cond = FastCondition(threading.Lock())
         self._Event__flag = False
+        self._wakers = []
+    def add_waker(self, func):
+        with self._Event__cond:
+            self._wakers.append(func)
+    def remove_waker(self, func):
+        with self._Event__cond:
+            try:
+                self._wakers.remove(func)
+            except ValueError:
+                pass
+    def set(self):
+        super(FastEvent, self).set()
+        with self._Event__cond:
+            wakers = self._wakers[:]
+        for func in wakers:
+            func()
 
 class FastCondition(threading._Condition):
     def wait(self, timeout=None):
@@ -339,8 +536,9 @@ class FastCondition(threading._Condition):
                 # Balancing act:  We can't afford a pure busy loop, so we
                 # have to sleep; but if we sleep the whole timeout time,
                 # we'll be unresponsive.
+                # The wait starts short so a quick notify is seen in less than 1 ms.
                 func = lambda : waiter.acquire(0)
-                gotit = _retry_wait(func, timeout, delay=0.01)
+                gotit = _retry_wait(func, timeout, delay=0.01, min_delay=0.0001)
                 if not gotit:
                     if __debug__:
                         self._note("%s.wait(%s): timed out", self, timeout)
@@ -373,10 +571,44 @@ class FastCondition(threading._Condition):
 #Enable basic async for any device (like sr830) by allowing a delay before performing mesurement
 #Allow to chain one device on completion of another one.
 
-class asyncThread(threading.Thread):
-    def __init__(self, operations, lock_instrument, lock_extra, init_ops, detect=None, delay=0., trig=None, cleanup=None):
-        super(asyncThread, self).__init__()
+class _AsyncWorker(threading.Thread):
+    """
+    A persistent thread that executes the asyncThread tasks of an instrument
+    one after the other. This avoids creating a new thread for every async get.
+    It should not keep a reference to the instrument (so it can be deleted).
+    """
+    def __init__(self, name='pyHegel async worker'):
+        super(_AsyncWorker, self).__init__(name=name)
         self.daemon = True
+        self._queue = Queue.Queue()
+    def submit(self, task):
+        self._queue.put(task)
+    def stop(self):
+        self._queue.put(None)
+    def run(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                break
+            try:
+                task.run()
+            except:
+                # same behavior as a Thread: show it and continue.
+                sys.stderr.write('Exception in %s:\n'%self.name)
+                traceback.print_exc()
+                sys.exc_clear()
+            finally:
+                task._done.set()
+            # Don't keep a reference to the task (and the instrument) while idle.
+            del task
+
+class asyncThread(object):
+    """
+    This is the async task of an instrument.
+    It behaves like a Thread (start, is_alive, wait) but when a worker is given
+    it is executed by that persistent thread instead of a new one.
+    """
+    def __init__(self, operations, lock_instrument, lock_extra, init_ops, detect=None, delay=0., trig=None, cleanup=None, worker=None):
         self._stop = False
         self._async_delay = delay
         self._async_trig = trig
@@ -388,6 +620,12 @@ class asyncThread(threading.Thread):
         self._init_ops = init_ops # a list of (func, args, kwargs)
         self.results = []
         self._replace_index = 0
+        self._worker = worker
+        self._started = False
+        self._done = FastEvent()
+        # the time interval of run (once the locks are acquired)
+        self.run_start = None
+        self.run_end = None
     def add_init_op(self, func, *args, **kwargs):
         self._init_ops.append((func, args, kwargs))
     def change_delay(self, new_delay):
@@ -403,8 +641,29 @@ class asyncThread(threading.Thread):
             index = self._replace_index
             self._replace_index += 1
         self.results[index] = val
+    def start(self):
+        if self._started:
+            raise RuntimeError("tasks can only be started once")
+        self._started = True
+        if self._worker is not None:
+            self._worker.submit(self)
+        else:
+            th = threading.Thread(target=self._run_thread)
+            th.daemon = True
+            th.start()
+    def _run_thread(self):
+        try:
+            self.run()
+        finally:
+            self._done.set()
     @locked_calling
     def run(self):
+        self.run_start = time.time()
+        try:
+            self._run_ops()
+        finally:
+            self.run_end = time.time()
+    def _run_ops(self):
         #t0 = time.time()
         for f, args, kwargs in self._init_ops:
             f(*args, **kwargs)
@@ -433,17 +692,79 @@ class asyncThread(threading.Thread):
         #print 'Thread finished in ', time.time()-t0
     def cancel(self):
         self._stop = True
+    def is_alive(self):
+        return self._started and not self._done.is_set()
+    def add_waker(self, func):
+        self._done.add_waker(func)
+    def remove_waker(self, func):
+        self._done.remove_waker(func)
     def wait(self, timeout=None):
-        # we use a the context manager because join uses sleep.
-        with _sleep_signal_context_manager():
-            self.join(timeout)
-        return not self.is_alive()
+        if timeout is None:
+            while not self._done.wait(0.2):
+                pass
+            return True
+        return self._done.wait(timeout)
 
 
 # For proper KeyboardInterrupt handling, the docheck function should
 # be internally protected with _sleep_signal_context_manager
 # This is the case for FastEvent and any function using sleep instead of time.sleep
 
+# The interval (s) at which the Qt waiting loop checks for timeout, errors and CTRL-C
+wait_on_event_qt_check = 0.05
+
+class _QtWaker(QtCore.QObject):
+    # emit can be called from any thread. The connected slots
+    # (in the main thread) are called in the main thread event loop.
+    wakeup = QtCore.Signal()
+
+def _wait_on_event_qt(task_or_event, check_state=None, max_time=None):
+    # Waits by running a Qt event loop. The loop is stopped by a waker
+    # (for completion) or by a timer (for max_time, check_state and CTRL-C).
+    # So the GUI stays alive and completion is detected without a polling delay.
+    start_time = time.time()
+    loop = QtCore.QEventLoop()
+    waker = _QtWaker()
+    waker.wakeup.connect(loop.quit)
+    timer = QtCore.QTimer()
+    timer.setInterval(int(wait_on_event_qt_check*1000))
+    state = dict(timeout=False)
+    with _delayed_signal_context_manager() as context:
+        def check():
+            if context.signaled:
+                loop.quit()
+            elif check_state != None and check_state._error_state:
+                loop.quit()
+            elif max_time != None and time.time()-start_time > max_time:
+                state['timeout'] = True
+                loop.quit()
+        timer.timeout.connect(check)
+        wake = waker.wakeup.emit
+        task_or_event.add_waker(wake)
+        try:
+            # It could have finished before the waker was installed
+            if task_or_event.wait(0):
+                return True
+            timer.start()
+            loop.exec_()
+            timer.stop()
+        finally:
+            task_or_event.remove_waker(wake)
+    # We get here only if CTRL-C was not pressed (otherwise exception raised)
+    if task_or_event.wait(0):
+        return True
+    if state['timeout']:
+        return False
+    # check_state error
+    return None
+
+def _use_qt_wait(obj):
+    if not hasattr(obj, 'add_waker'):
+        return False
+    if not isinstance(threading.current_thread(), threading._MainThread):
+        return False
+    return QtGui.QApplication.instance() is not None
+
 def wait_on_event(task_or_event_or_func, check_state = None, max_time=None):
     # task_or_event_or_func either needs to have a wait attribute with a parameter of
     # seconds. Or it should be a function accepting a parameter of time in s.
@@ -457,6 +778,11 @@ def wait_on_event(task_or_event_or_func, check_state = None, max_time=None):
     # therefore, using Event.wait can produce times of 10, 20, 30, 40, 60, 100, 150
     # 200 ms ...
     # Can use FastEvent.wait instead of Event.wait to be faster
+    # For objects that accept wakers (FastEvent, asyncThread) in the main
+    # thread with a Qt application, a Qt event loop is used instead so
+    # the completion is detected immediately.
+    if _use_qt_wait(task_or_event_or_func):
+        return _wait_on_event_qt(task_or_event_or_func, check_state, max_time)
     start_time = time.time()
     try: # should work for task (threading.Thread) and event (threading.Event)
         docheck = task_or_event_or_func.wait
@@ -523,6 +849,11 @@ class BaseDevice(object):
         The sets and check have one positional parameter, which is the value.
         They can have multiple keyword parameters
     """
+    # see set_cache_policy
+    _cache_policy = None
+    _cache_threshold = None
+    # set when the cache_budget dropped the value but could not get the lock
+    _cache_stale = False
     def __init__(self, autoinit=True, doc='', setget=False, allow_kw_as_dict=False,
                   allow_missing_dict=False,
                   min=None, max=None, choices=None, multi=False, graph=True,
@@ -611,6 +942,7 @@ class BaseDevice(object):
             val = None
         else:
             raise RuntimeError(self.perror('set can only have one positional parameter'))
+        stats_t0 = time.time() if dev_stats.enabled else None
         if self._allow_kw_as_dict:
             if val == None:
                 val = dict()
@@ -635,9 +967,20 @@ class BaseDevice(object):
         elif self._setdev_p == None:
             raise NotImplementedError, self.perror('This device does not handle _setdev')
         # only change cache after succesfull _setdev
-        self.setcache(val)
+        combiner = getattr(self.instr, '_combiner', None)
+        if combiner is not None and combiner.owner == thread.get_ident():
+            # the write is not sent yet (see visaInstrument.combined_writes)
+            combiner.defer_cache(self, val)
+        else:
+            self.setcache(val)
+        if self.instr is not None:
+            _conf_cache_clear(self.instr)
+        if stats_t0 is not None:
+            dev_stats.record(self, 'set', time.time()-stats_t0)
     @locked_calling_dev
     def get(self, **kwarg):
+        stats_t0 = time.time() if dev_stats.enabled else None
+        written = None
         if not CHECKING:
             self._last_filename = None
             format = self.getformat(**kwarg)
@@ -653,6 +996,8 @@ class BaseDevice(object):
                 _write_dev(ret, filename, format=format)
                 if format['bin']:
                     ret = None
+                else:
+                    written = ret
             else:
                 ret = self._getdev(**kwarg)
         elif self._getdev_p == None:
@@ -660,6 +1005,10 @@ class BaseDevice(object):
         else:
             ret = self.getcache()
         self.setcache(ret)
+        if written is not None:
+            self._cache_written(written)
+        if stats_t0 is not None:
+            dev_stats.record(self, 'get', time.time()-stats_t0)
         return ret
     #@locked_calling_dev
     def getcache(self, local=False):
@@ -676,19 +1025,21 @@ class BaseDevice(object):
         """
         if local:
             try:
-                return self._local_data.cache
+                return self._cache_unwrap(self._local_data.cache)
             except AttributeError:
                 return None
         # local is False
         with self.instr._lock_instrument: # only local data, so don't need _lock_extra
-            if self._cache==None and self._autoinit:
+            if self._cache_stale:
+                self._cache_evict_locked()
+            if self._cache is None and self._autoinit:
                 # This can fail, but getcache should not care for
                 #InvalidAutoArgument exceptions
                 try:
                     return self.get()
                 except InvalidAutoArgument:
                     self._cache = None
-            return self._cache
+            return self._cache_unwrap(self._cache)
     def _do_redir_async(self):
         obj = self
         # go through all redirections
@@ -712,16 +1063,104 @@ class BaseDevice(object):
                 self._last_filename = obj._last_filename
         if async == 3:
             # update the obj local thread cache data.
-            obj._local_data.cache = ret
+            obj._local_data.cache = obj._cache_local_value(ret)
         return ret
+    def set_cache_policy(self, policy=None, threshold=None):
+        """
+        Selects what the cache keeps for large values (numpy arrays larger than
+        threshold bytes, defaults to instruments_base.cache_large_threshold):
+         'keep':  the value is kept (the normal behavior for all values)
+         'weak':  only a weak reference is kept (the value is available
+                  as long as something else keeps it)
+         'drop':  the value is not kept (the cache becomes None)
+         'write': the value is kept until it is written to a file (by sweep,
+                  record, get with filename ...)
+         None:    use instruments_base.cache_default_policy
+        All the policies respect instruments_base.cache_budget.
+        """
+        if policy not in _cache_policies + [None]:
+            raise ValueError(self.perror('Invalid cache policy. Use one of %r'%_cache_policies))
+        self._cache_policy = policy
+        self._cache_threshold = threshold
+    def _cache_is_large(self, val):
+        threshold = self._cache_threshold
+        if threshold is None:
+            threshold = cache_large_threshold
+        nbytes = _cache_nbytes(val)
+        return nbytes > threshold, nbytes
+    def _cache_value(self, val):
+        # returns what the main cache keeps for val
+        large, nbytes = self._cache_is_large(val)
+        if not large:
+            if _large_caches:
+                _large_cache_unregister(self)
+            return val
+        policy = self._cache_policy or cache_default_policy
+        if policy in ('weak', 'drop'):
+            _large_cache_unregister(self)
+            if policy == 'weak':
+                try:
+                    return _WeakCache(val)
+                except TypeError: # lists, tuples and dict don't allow weak references
+                    pass
+            return None
+        for dev in _large_cache_register(self, nbytes):
+            dev._cache_evict()
+        return val
+    def _cache_local_value(self, val):
+        # The thread local caches (one per thread, including the async
+        # workers) don't keep large values when a policy or budget is active.
+        policy = self._cache_policy or cache_default_policy
+        if policy == 'keep' and cache_budget is None:
+            return val
+        if not self._cache_is_large(val)[0]:
+            return val
+        try:
+            return _WeakCache(val)
+        except TypeError:
+            return None
+    def _cache_unwrap(self, val):
+        if isinstance(val, _WeakCache):
+            return val.ref()
+        return val
+    def _cache_drop(self):
+        # Forget the cached value (to free memory)
+        _large_cache_unregister(self)
+        self._cache = None
+        self._local_data.cache = None
+    def _cache_evict(self):
+        # Called when cache_budget drops this value (from the setcache of
+        # another device, possibly of another instrument and thread).
+        # Waiting for this instrument lock could deadlock, so when it is busy
+        # the value is only marked stale and dropped on the next getcache.
+        lock = self.instr._lock_instrument
+        if lock.acquire_timeout(0):
+            try:
+                self._cache_evict_locked()
+            finally:
+                lock.release()
+        else:
+            self._cache_stale = True
+    def _cache_evict_locked(self):
+        # A new value registered since the eviction is kept.
+        self._cache_stale = False
+        with _large_caches_lock:
+            if id(self) in _large_caches:
+                return
+        self._cache = None
+    def _cache_written(self, val):
+        # called after val was written to a file
+        if (self._cache_policy or cache_default_policy) == 'write' and self._cache_unwrap(self._cache) is val:
+            self._cache_drop()
     #@locked_calling_dev
     def setcache(self, val, nolock=False):
+        main = self._cache_value(val)
         if nolock == True:
-            self._cache = val
+            self._cache = main
         else:
             with self.instr._lock_instrument: # only local data, so don't need _lock_extra
-                self._cache = val
-        self._local_data.cache = val # thread local, requires no lock
+                self._cache = main
+        self._local_data.cache = self._cache_local_value(val) # thread local, requires no lock
     def __call__(self, val=None):
         raise SyntaxError, """Do NOT call a device directly, like instr.dev().
         Instead use set/get on the device or
@@ -893,6 +1332,8 @@ class MetaClassInit(type):
 class BaseInstrument(object):
     __metaclass__ = MetaClassInit
     alias = None
+    # When False, every async get uses a new thread (the old behavior)
+    _async_use_worker = True
     def __init__(self, quiet_delete=False):
         self._quiet_delete = quiet_delete
         self.header_val = None
@@ -901,6 +1342,8 @@ class BaseInstrument(object):
             # don't overwrite what is assigned in subclasses
             self._lock_extra = Lock_Extra()
         self._async_mode = 'wait'
+        self._async_worker = None
+        self._conf_cache = {}
         self._create_devs()
         self._async_local_data = threading.local()
         self._async_wait_check = True
@@ -910,6 +1353,20 @@ class BaseInstrument(object):
     def __del__(self):
         if not self._quiet_delete:
             print 'Destroying '+repr(self)
+        worker = getattr(self, '_async_worker', None)
+        if worker is not None:
+            worker.stop()
+    def _get_async_worker(self):
+        # The worker is created on first use and reused for all the
+        # following async gets (see asyncThread).
+        if not self._async_use_worker:
+            return None
+        worker = self._async_worker
+        if worker is None or not worker.is_alive():
+            worker = _AsyncWorker('pyHegel async worker for %s'%self.__class__.__name__)
+            worker.start()
+            self._async_worker = worker
+        return worker
     def _async_select(self, devs):
         """ It receives a list of devices to help decide how to wait.
             The list entries can be in the form (dev, option_dict) or just dev
@@ -962,6 +1419,40 @@ class BaseInstrument(object):
             self.wait_after_trig()
         finally: # in case we were stopped because of KeyboardInterrupt or something else.
             self._async_cleanup_after()
+    # List (hardware) sweeps, used by sweep(..., list_sweep=True)
+    # A source instrument that can step by itself through a list of values
+    # (on a timer, producing a trigger output for every point) returns the
+    # devices it can sweep in _list_sweep_devs and implements list_sweep_setup,
+    # list_sweep_start and list_sweep_wait.
+    # A meter that can be armed to take one reading on every external trigger
+    # and return all of them at the end returns its devices in _list_acq_devs and
+    # implements list_acq_arm and list_acq_fetch.
+    def _list_sweep_devs(self):
+        return []
+    def _list_acq_devs(self):
+        return []
+    def list_sweep_setup(self, dev, values, dwell):
+        """
+        Uploads the list of values for dev. Every value should be kept
+        for dwell seconds, with a trigger output at the start of each one.
+        """
+        raise NotImplementedError, self.perror('This instrument class does not implement list sweeps')
+    def list_sweep_start(self, dev):
+        """ Starts a previously setup list sweep """
+        raise NotImplementedError, self.perror('This instrument class does not implement list sweeps')
+    def list_sweep_wait(self, dev):
+        """ Waits for the end of the list sweep. dev cache should then be updated. """
+        raise NotImplementedError, self.perror('This instrument class does not implement list sweeps')
+    def list_acq_arm(self, dev, npts):
+        """ Prepares dev to acquire npts, one for every trigger received """
+        raise NotImplementedError, self.perror('This instrument class does not implement list acquisitions')
+    def list_acq_fetch(self, dev, npts):
+        """
+        Returns the npts values acquired after list_acq_arm.
+        Returns an array of shape (npts,) or (npts, ncols) (ncols the number of
+        headers of dev).
+        """
+        raise NotImplementedError, self.perror('This instrument class does not implement list acquisitions')
     def _get_async_local_data(self):
         d = self._async_local_data
         try:
@@ -992,6 +1483,8 @@ class BaseInstrument(object):
             if data.async_level > 1:
                 data.async_task.cancel()
             data.async_level = -1
+            # don't keep the task (and its results) around
+            data.async_task = None
         if async != 3 and not (async == 2 and data.async_level == -1) and (
           async < data.async_level or async > data.async_level + 1):
             if data.async_level > 1:
@@ -1004,7 +1497,8 @@ class BaseInstrument(object):
                 data.async_select_list = []
                 data.async_list_init = [(self._async_select, (data.async_select_list, ), {})]
                 delay = self.async_delay.getcache()
-                data.async_task = asyncThread(data.async_list, self._lock_instrument, self._lock_extra, data.async_list_init, delay=delay)
+                data.async_task = asyncThread(data.async_list, self._lock_instrument, self._lock_extra, data.async_list_init, delay=delay,
+                                              worker=self._get_async_worker())
                 data.async_list_init.append((self._under_async_setup, (data.async_task,), {}))
                 data.async_level = 0
             if trig:
@@ -1028,9 +1522,12 @@ class BaseInstrument(object):
         elif async == 3: # get values
             #print 'async', async, 'self', self, 'time', time.time()
             #return obj.getcache()
-            ret = data.async_task.results[data.async_counter]
+            results = data.async_task.results
+            ret = results[data.async_counter]
             # Need to copy the _last_filename item because it is thread local
-            self._last_filename = data.async_task.results[data.async_counter+1]
+            self._last_filename = results[data.async_counter+1]
+            # The task only needs to keep the results not yet returned
+            results[data.async_counter] = None
             data.async_counter += 2
             if data.async_counter == len(data.async_task.results):
                 # delete task so that instrument can be deleted
@@ -1233,10 +1730,7 @@ class BaseInstrument(object):
         """
         return "Undefined identification,X,0,0"
     def idn_split(self):
-        idn = self.idn()
-        parts = idn.split(',', 4) # There could be , in serial firmware revision
-        # I also use lstrip because some device put a space after the comma.
-        return dict(vendor=parts[0], model=parts[1].lstrip(), serial=parts[2].lstrip(), firmware=parts[3].lstrip())
+        return _idn_split(self.idn())
     def _info(self):
         return self.find_global_name(), self.__class__.__name__, id(self)
     def __repr__(self):
@@ -1567,8 +2061,22 @@ class scpiDevice(BaseDevice):
             raise
         command = self._getdev_p
         command = command.format(**options)
+        block_type = self._block_stream_type()
+        if block_type is not None:
+            return self.instr.ask_block(command, block_type, fallback=self._fromstr)
         ret = self.instr.ask(command, self._raw, **self._ask_write_opt)
         return self._fromstr(ret)
+    def _block_stream_type(self):
+        # returns the numpy type when the get can be done with ask_block
+        # (see visaInstrument._block_streaming) otherwise None
+        t = self.type
+        if not self._raw or self._ask_write_opt or not isinstance(t, functools.partial) or \
+                t.func not in (_decode_block, _decode_block_auto) or t.args or \
+                t.keywords.get('sep') is not None:
+            return None
+        if not getattr(self.instr, '_block_streaming', False):
+            return None
+        return t.keywords.get('t', np.float64)
     def check(self, val, **kwarg):
         #TODO handle checking of kwarg
         super(scpiDevice, self).check(val)
@@ -1602,6 +2110,28 @@ class ReadvalDev(BaseDevice):
         d['obj'] = self
         return d
 
+def _split_compound_answer(s, sep=';'):
+    """
+    Splits the answer to a compound query (the answers are separated
+    by sep) without splitting quoted strings.
+    """
+    if '"' not in s and "'" not in s:
+        return s.split(sep)
+    parts = []
+    start = 0
+    quote = None
+    for i, c in enumerate(s):
+        if quote is not None:
+            if c == quote:
+                quote = None
+        elif c in '"\'':
+            quote = c
+        elif c == sep:
+            parts.append(s[start:i])
+            start = i+1
+    parts.append(s[start:])
+    return parts
+
 def _decode_block_header(s):
     """
        Takes a string with the scpi block header
@@ -1620,20 +2150,48 @@ def _decode_block_header(s):
     nbytes = int(s[2:2+nh])
     return slice(2+nh, None), nbytes, 2+nh
 
-def _decode_block_base(s):
-    sl, nb, nh = _decode_block_header(s)
-    block = s[sl]
-    lb = len(block)
+def _decode_block_range(s, offset=0):
+    """
+       Same as _decode_block_base but returns the (start, stop) indices
+       of the data within s instead of a copy.
+       offset is the position of the block header in s.
+       s can also be a bytearray.
+    """
+    sl, nb, nh = _decode_block_header(str(s[offset:offset+12]))
+    start = offset + nh
+    lb = len(s) - start
     if nb != -1:
         if lb < nb :
             raise IndexError, 'Missing data for decoding. Got %i, expected %i'%(lb, nb)
         elif lb > nb :
-            if lb-nb == 1 and (s[-1] in '\r\n'):
-                return block[:-1]
+            if lb-nb == 1 and (s[-1:] in ('\r', '\n')):
+                return start, len(s)-1
             elif lb-nb == 2 and s[-2:] == '\r\n':
-                return block[:-2]
-            raise IndexError, 'Extra data in for decoding. Got %i ("%s ..."), expected %i'%(lb, block[nb:nb+10], nb)
-    return block
+                return start, len(s)-2
+            raise IndexError, 'Extra data in for decoding. Got %i ("%s ..."), expected %i'%(lb, s[start+nb:start+nb+10], nb)
+    return start, len(s)
+
+def _decode_block_base(s):
+    start, stop = _decode_block_range(s)
+    return s[start:stop]
+
+def _frombuffer(s, t, start=0, stop=None):
+    """
+       Returns the data between start and stop of the string (or bytearray,
+       numpy array ...) s as a numpy array of type t.
+       The array is always writable: it is a view of s when s is writable
+       (no copy), otherwise (s is a string) the data is copied once.
+    """
+    if stop is None:
+        stop = len(s)
+    t = np.dtype(t)
+    n = stop - start
+    if n % t.itemsize:
+        raise ValueError, 'string size must be a multiple of element size'
+    v = np.frombuffer(s, t, count=n//t.itemsize, offset=start)
+    if not v.flags.writeable:
+        v = v.copy()
+    return v
 
 def _encode_block_base(s):
     """
@@ -1650,10 +2208,15 @@ def _decode_block(s, t=np.float64, sep=None):
         sep can be None for binaray encoding or ',' for ascii csv encoding
         type can be np.float64 float32 int8 int16 int32 uint8 uint16 ...
               or it can be entered as a string like 'float64'
+              The endianness can be selected with the type (like '>f4')
+        For binary encoding, the data is copied only once from a string
+        (not at all from a writable buffer like a bytearray). The returned
+        array is writable.
     """
-    block = _decode_block_base(s)
     if sep == None:
-        return np.fromstring(block, t)
+        start, stop = _decode_block_range(s)
+        return _frombuffer(s, t, start, stop)
+    block = _decode_block_base(s)
     return np.fromstring(block, t, sep=sep)
 
 def _encode_block(v, sep=None):
@@ -1689,7 +2252,7 @@ class Block_Codec_Raw(object):
     def __init__(self, dtype=np.float64, sep=None):
         self._dtype = dtype
     def __call__(self, input_str):
-        return np.fromstring(input_str, self._dtype)
+        return _frombuffer(input_str, self._dtype)
     def tostr(self, array):
         return array.tostring()
 
@@ -2352,6 +2915,82 @@ class Lock_Visa(object):
 #######################################################
 ##    VISA Instrument
 #######################################################
+
+class _WriteCombiner(object):
+    """ see visaInstrument.combined_writes """
+    def __init__(self, instr, max_length):
+        self.instr = instr
+        self.max_length = max_length
+        self.owner = None
+        self._nested = False
+        self._cmds = []
+        self._length = 0
+        self._caches = []
+    def __enter__(self):
+        instr = self.instr
+        instr._lock_instrument.acquire()
+        current = instr._combiner
+        if current is not None:
+            # already combining (in this thread since we have the lock)
+            self._nested = True
+            return current
+        instr._lock_extra.acquire()
+        self.owner = thread.get_ident()
+        instr._combiner = self
+        return self
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        instr = self.instr
+        if self._nested:
+            instr._lock_instrument.release()
+            return
+        try:
+            if exc_type is None:
+                self.flush()
+        finally:
+            instr._combiner = None
+            self._cmds = []
+            self._caches = []
+            instr._lock_extra.release()
+            instr._lock_instrument.release()
+    def add(self, cmd):
+        if self._cmds and cmd[:1] not in (':', '*'):
+            # following commands need to restart from the root of the command tree
+            cmd = ':' + cmd
+        if self._cmds and self._length + 1 + len(cmd) > self.max_length:
+            self.flush()
+        if self._cmds:
+            self._length += 1 + len(cmd)
+        else:
+            self._length = len(cmd)
+        self._cmds.append(cmd)
+    def defer_cache(self, dev, val):
+        if self._cmds:
+            self._caches.append((dev, val))
+        else:
+            # the write was already sent (the set did a flush)
+            dev.setcache(val)
+    def flush(self):
+        if not self._cmds:
+            return
+        cmds, caches = self._cmds, self._caches
+        self._cmds, self._caches, self._length = [], [], 0
+        instr = self.instr
+        instr._combiner = None
+        try:
+            instr.write(';'.join(cmds))
+        finally:
+            instr._combiner = self
+        for dev, val in caches:
+            dev.setcache(val)
+    def ask(self, question, raw=False):
+        self.flush()
+        instr = self.instr
+        instr._combiner = None
+        try:
+            return instr.ask(question, raw)
+        finally:
+            instr._combiner = self
+
 _SharedStructure_debug = False
 class _SharedStructure(object):
     """
@@ -2422,6 +3061,14 @@ class visaInstrument(BaseInstrument):
           'USB0::0x0957::0x0118::MY49012345::0::INSTR'
           'USB::0x0957::0x0118::MY49012345'
     """
+    # maximum length of the compound messages (batch_get, combined_writes)
+    _batch_max_length = 250
+    # When True, the raw block gets of scpiDevice (with decode_float64 ...)
+    # use ask_block. Only enable it for instruments that terminate their
+    # blocks with a newline.
+    _block_streaming = False
+    _block_chunk_size = 1024*1024
+    _combiner = None
     def __init__(self, visa_addr, skip_id_test=False, quiet_delete=False, **kwarg):
         # need to initialize visa before calling BaseInstrument init
         # which might require access to device
@@ -2540,17 +3187,28 @@ class visaInstrument(BaseInstrument):
             sleep(delta)
     @locked_calling
     def read(self, raw=False):
+        if self._combiner is not None:
+            self._combiner.flush()
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
         if raw:
             ret = self.visa.read_raw()
         else:
             ret = self.visa.read()
         self._last_rw_time.read_time = time.time()
+        if stats_t0 is not None:
+            _record_io(self, 'read', None, stats_t0, self._last_rw_time.read_time, len(ret))
         return ret
     @locked_calling
     def write(self, val):
+        if self._combiner is not None:
+            self._combiner.add(val)
+            return
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
         self._do_wr_wait()
         self.visa.write(val)
         self._last_rw_time.write_time = time.time()
+        if stats_t0 is not None:
+            _record_io(self, 'write', val, stats_t0, self._last_rw_time.write_time, len(val))
     @locked_calling
     def ask(self, question, raw=False):
         """
@@ -2559,11 +3217,186 @@ class visaInstrument(BaseInstrument):
         This is needed when dealing with binary data. The
         base read strips newlines from the end always.
         """
+        if self._combiner is not None:
+            return self._combiner.ask(question, raw)
         # we prevent CTRL-C from breaking between write and read using context manager
-        with _delayed_signal_context_manager():
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
+        with _delayed_signal_context_manager(), traffic.in_ask:
             self.write(question)
             ret = self.read(raw)
+        if stats_t0 is not None:
+            _record_io(self, 'ask', question, stats_t0, time.time(), len(ret))
         return ret
+    def _batch_get_query(self, dev, kwarg):
+        # returns the query string of dev or None when it cannot be batched
+        if not isinstance(dev, scpiDevice) or dev.instr is not weakref.proxy(self):
+            return None
+        if dev._getdev_p is None or dev._raw or dev._ask_write_opt or \
+                type(dev)._getdev.im_func is not scpiDevice._getdev.im_func or \
+                type(dev).get.im_func is not BaseDevice.get.im_func or \
+                kwarg.get('filename', False):
+            return None
+        # same bookkeeping as BaseDevice.get
+        dev._last_filename = None
+        dev.getformat(**kwarg)
+        kwarg = kwarg.copy()
+        for k in ['graph', 'bin', 'extra_conf']:
+            kwarg.pop(k, None)
+        try:
+            options = dev._combine_options(**kwarg)
+        except InvalidAutoArgument:
+            dev.setcache(None)
+            raise
+        q = dev._getdev_p.format(**options)
+        if len(_split_compound_answer(q)) > 1:
+            # already a compound query: its answer has more than one part
+            return None
+        return q
+    @locked_calling
+    def batch_get(self, devs, max_length=None):
+        """
+        Reads all the devices in devs (a list of devices or of (dev, dict_of_options))
+        using the least number of queries: the scpiDevice queries are
+        joined with ';' (up to max_length characters, defaults to
+        _batch_max_length) and the answer is split to update each device cache.
+        The devices that cannot be combined (raw, with special get, or with
+        a query that is already a compound one) are read separately.
+        Returns the list of values.
+        The instrument needs to handle compound queries (most SCPI instruments do).
+        In checking mode, it returns the caches (like get).
+        """
+        if CHECKING:
+            return [dev[0].get(**dev[1]) if isinstance(dev, tuple) else dev.get() for dev in devs]
+        if max_length is None:
+            max_length = self._batch_max_length
+        ret = [None]*len(devs)
+        batch = []
+        batch_len = 0
+        todo = []
+        for i, dev in enumerate(devs):
+            if isinstance(dev, tuple):
+                dev, kwarg = dev
+            else:
+                kwarg = {}
+            q = self._batch_get_query(dev, kwarg)
+            if q is None:
+                ret[i] = dev.get(**kwarg)
+                continue
+            if batch and q[0] not in ':*':
+                # following queries need to restart from the root of the command tree
+                q = ':' + q
+            if batch and batch_len + 1 + len(q) > max_length:
+                todo.append(batch)
+                batch = []
+            if not batch:
+                batch_len = len(q)
+            else:
+                batch_len += 1 + len(q)
+            batch.append((i, dev, q))
+        if batch:
+            todo.append(batch)
+        for batch in todo:
+            stats_t0 = time.time() if dev_stats.enabled else None
+            ans = self.ask(';'.join(q for i, dev, q in batch))
+            parts = _split_compound_answer(ans)
+            if len(parts) != len(batch):
+                raise RuntimeError(self.perror('batch_get received %i answers instead of %i'%(len(parts), len(batch))))
+            for (i, dev, q), part in zip(batch, parts):
+                val = dev._fromstr(part.strip())
+                dev.setcache(val)
+                ret[i] = val
+            if stats_t0 is not None:
+                # every device of the batch gets an equal share of the time
+                dt = (time.time()-stats_t0)/len(batch)
+                for i, dev, q in batch:
+                    dev_stats.record(dev, 'get', dt)
+        return ret
+    @locked_calling
+    def read_block(self, t='uint8', out=None, progress=None, chunk_size=None, termination=True, fallback=None):
+        """
+        Reads a scpi binary block (#N<len><data>) in chunks directly into
+        a numpy array of type t (so no extra copy of the data is needed).
+        out:         an array (of type t, contiguous, large enough) to reuse.
+                     The returned array is then a view of its beginning.
+        progress:    when given, it is called as progress(nbytes_read, nbytes_total)
+                     after every chunk.
+        chunk_size:  in bytes (defaults to _block_chunk_size)
+        termination: when True, the character following the block (normally
+                     a newline) is read and discarded.
+        fallback:    when the answer is not a definite length block, the full
+                     answer (string) is passed to fallback and its result returned.
+                     Without it, a ValueError is raised.
+        """
+        if self._combiner is not None:
+            self._combiner.flush()
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
+        vi = self.visa
+        head, ended = vi.read_raw_n_end(2)
+        if len(head) < 2 or head[0] != '#' or head[1] == '0':
+            # short answers (like '0\n') are already complete
+            answer = head if ended else head + vi.read_raw()
+            self._last_rw_time.read_time = time.time()
+            if fallback is None:
+                raise ValueError(self.perror('The answer is not a definite length block: %r'%answer[:20]))
+            return fallback(answer)
+        nbytes = int(vi.read_raw_n(int(head[1])))
+        t = np.dtype(t)
+        if nbytes % t.itemsize:
+            raise ValueError(self.perror('The block size (%i) is not a multiple of the type size'%nbytes))
+        n = nbytes // t.itemsize
+        if out is None:
+            data = np.empty(n, t)
+        else:
+            if out.dtype != t or not out.flags.c_contiguous or out.size < n:
+                raise ValueError(self.perror('out needs to be a contiguous array of type %s with at least %i elements'%(t, n)))
+            data = out.reshape(-1)[:n]
+        buf = data.view(np.uint8)
+        if chunk_size is None:
+            chunk_size = self._block_chunk_size
+        done = 0
+        while done < nbytes:
+            k = vi.read_raw_into(buf, done, min(chunk_size, nbytes-done))
+            if k == 0:
+                raise IOError(self.perror('No data received after %i of %i bytes'%(done, nbytes)))
+            done += k
+            if progress is not None:
+                progress(done, nbytes)
+        if termination:
+            vi.read_raw_n(1)
+        self._last_rw_time.read_time = time.time()
+        if stats_t0 is not None:
+            _record_io(self, 'read', None, stats_t0, self._last_rw_time.read_time, nbytes)
+        return data
+    @locked_calling
+    def ask_block(self, question, t='uint8', **kwarg):
+        """
+        Does write then read_block (see read_block for the other parameters).
+        """
+        stats_t0 = time.time() if dev_stats.enabled or traffic.enabled else None
+        with _delayed_signal_context_manager(), traffic.in_ask:
+            self.write(question)
+            ret = self.read_block(t, **kwarg)
+        if stats_t0 is not None:
+            _record_io(self, 'ask', question, stats_t0, time.time(), getattr(ret, 'nbytes', len(ret)))
+        return ret
+    def combined_writes(self, max_length=None):
+        """
+        Returns a context manager that combines all the writes (and so
+        the scpiDevice sets) done inside it into as few messages as possible:
+            with instr.combined_writes():
+                instr.dev1.set(1)
+                instr.dev2.set(2)
+        The commands are joined with ';' (up to max_length characters, defaults
+        to _batch_max_length) and sent when the buffer is full, before any
+        read/ask and at the end. The device caches are only updated once the
+        message containing their command is sent successfully.
+        If an exception happens inside the block, the writes not yet sent
+        are dropped.
+        The instrument stays locked for the whole block.
+        """
+        if max_length is None:
+            max_length = self._batch_max_length
+        return _WriteCombiner(self, max_length)
     def idn(self):
         return self.ask('*idn?')
     def idn_usb(self):
@@ -2764,7 +3597,7 @@ class visaInstrumentAsync(visaInstrument):
             if not super(visaInstrumentAsync, self)._async_detect(max_time):
                 return False
         if self._async_polling:
-            if _retry_wait(self._async_detect_poll_func, max_time, delay=0.05):
+            if _retry_wait(self._async_detect_poll_func, max_time, delay=0.05, min_delay=0.001):
                 ret = True
         elif self._RQS_status == -1:
             # On National Instrument (NI) visa
@@ -2880,6 +3713,39 @@ def _normalize_gpib(gpib_resrc):
     else:
         raise TypeError('the address is not in an acceptable type.')
 
+def _bus_name(instr):
+    """
+    Returns the name of the physical bus used by instr. Instruments with
+    the same name share the bus, so their transfers are serialized.
+    GPIB instruments share their board (GPIB0, GPIB1 ...); the others
+    (LAN, USB, serial, non visa) are considered independent.
+    """
+    addr = getattr(instr, 'visa_addr', None)
+    if isinstance(addr, int):
+        return 'GPIB0'
+    if isinstance(addr, basestring):
+        board = addr.upper().split('::')[0]
+        if board.startswith('GPIB'):
+            return 'GPIB%s'%(board[4:] or '0')
+        return addr
+    # instr is normally a weakref.proxy which is the same for all the devices
+    return '%s-0x%x'%(instr.__class__.__name__, id(instr))
+
+def _visa_addr_key(visa_addr):
+    """
+    Returns a normalized visa address (the same for all the ways of
+    writing the address of an instrument).
+    """
+    try:
+        if isinstance(visa_addr, int) or visa_addr.upper().startswith('GPIB'):
+            return _normalize_gpib(visa_addr)
+        if visa_addr.upper().startswith('USB'):
+            return _normalize_usb(visa_addr)[0]
+    except (ValueError, AttributeError, IndexError, TypeError):
+        pass
+    if isinstance(visa_addr, basestring):
+        return visa_addr.upper()
+    return 'addr-%r'%(visa_addr,)
 
 def _get_visa_idns(visa_addr, *args, **kwargs):
     vi = visaInstrument(visa_addr, *args, skip_id_test=True, quiet_delete=True, **kwargs)
@@ -2887,6 +3753,51 @@ def _get_visa_idns(visa_addr, *args, **kwargs):
     del vi
     return idns
 
+def _visa_read_idns(visa_addr, **kwargs):
+    """
+    Returns the idns (like idn_split) from a *idn? query done on a bare
+    visa session, so no other command is sent to the instrument.
+    It is used to validate the discovery cache entries.
+    """
+    if isinstance(visa_addr, int):
+        visa_addr = _normalize_gpib(visa_addr)
+    vi = rsrc_mngr.open_resource(visa_addr, **kwargs)
+    try:
+        vi.timeout = 2900 # ms, same as visaInstrument
+        vi.write('*idn?')
+        idn = vi.read()
+    finally:
+        vi.close()
+    return _idn_split(idn)
+
+def _get_visa_idns_cached(visa_addr, *args, **kwargs):
+    """
+    Same as _get_visa_idns but uses the discovery cache. For a known address
+    the idn is only validated with a *idn? on a bare visa session
+    (_visa_read_idns), so no visaInstrument needs to be created. The
+    instrument is always queried. A new or changed idn updates the cache.
+    """
+    key = _visa_addr_key(visa_addr)
+    cached = discovery_cache.get(key)
+    idns = None
+    if cached is not None:
+        try:
+            idns = _visa_read_idns(visa_addr, **kwargs)
+        except (visa_wrap.VisaIOError, IndexError):
+            # not answering (or not a scpi idn): do the full identification
+            discovery_cache.forget(key)
+        else:
+            if discovery_cache.same_idn(cached, idns):
+                return idns
+    if idns is None:
+        idns = _get_visa_idns(visa_addr, *args, **kwargs)
+    try:
+        cls = instruments_registry.find_instr(idns['vendor'], idns['model'], idns['firmware'])
+    except KeyError:
+        cls = None
+    discovery_cache.put(key, idns, cls.__name__ if cls is not None else None)
+    return idns
+
 
 class visaAutoLoader(visaInstrument):
     """
@@ -2897,6 +3808,8 @@ class visaAutoLoader(visaInstrument):
     For usb devices it will try the usb registry first. Otherwise, like for all
     other device it will open it with visaInstrument first to read the idn then
     properly load it with the correct class.
+    For an address in the discovery cache (see idn_cache), the idn is read with
+    a bare visa session instead (see _get_visa_idns_cached).
     if skip_usb is set to True, then the usb search is skipped
     """
     def __new__(cls, visa_addr, skip_usb=False, *args, **kwargs):
@@ -2909,7 +3822,7 @@ class visaAutoLoader(visaInstrument):
             else:
                 print 'Autoloading(USB) using instruments class "%s"'%cls.__name__
                 return cls(visa_addr, *args, **kwargs)
-        idns = _get_visa_idns(visa_addr, *args, **kwargs)
+        idns = _get_visa_idns_cached(visa_addr, *args, **kwargs)
         try:
             cls = instruments_registry.find_instr(idns['vendor'], idns['model'], idns['firmware'])
         except KeyError:
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Async overhead benchmark: measures the per point cost of the async
+                  get sequence (the one used by sweep/record for every
+                  instrument) with the dummy instrument, using the
+                  persistent per-instrument worker or a new thread for
+                  every point (the old behavior).
+    To use, in pyHegel environment:
+        run -i async_worker_bench
+        bench_async() # or change some of the options
+"""
+
+import time
+import numpy as np
+from pyHegel import instruments
+
+
+def do_async_get(dev, start_times):
+    instr = dev.instr
+    dev.getasync(async=0)
+    task = instr._get_async_local_data().async_task
+    task.add_init_op(lambda: start_times.append(time.time()))
+    t = time.time()
+    dev.getasync(async=1)
+    dev.getasync(async=2)
+    dev.getasync(async=3)
+    return t
+
+def bench_one(instr, n, use_worker):
+    instr._async_use_worker = use_worker
+    dev = instr.incr
+    # warm up (creates the worker)
+    start_times = []
+    do_async_get(dev, start_times)
+    start_times = []
+    starts = []
+    t0 = time.time()
+    for i in range(n):
+        starts.append(do_async_get(dev, start_times))
+    total = time.time() - t0
+    latency = np.array(start_times) - np.array(starts)
+    return total/n, latency.mean(), latency.max()
+
+def bench_async(n=1000):
+    """
+       Does n async gets of dummy.incr (with no wait) with and without
+       the persistent worker and prints the time per point and the
+       latency between the start of the task and its execution (which
+       includes the thread creation time when no worker is used).
+    """
+    d = instruments.dummy()
+    d.wait = 0.
+    print '%-10s %15s %20s %20s'%('mode', 'per point (ms)', 'start latency (ms)', 'max latency (ms)')
+    for name, use_worker in [('thread', False), ('worker', True)]:
+        per_pt, lat, lat_max = bench_one(d, n, use_worker)
+        print '%-10s %15.3f %20.3f %20.3f'%(name, per_pt*1e3, lat*1e3, lat_max*1e3)
+    d._async_use_worker = True
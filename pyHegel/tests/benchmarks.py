@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Acquisition loop benchmarks: measures the points/s and the time per point
+                  of get, set, getasync, _readall_async, snap, sweep and record
+                  using the dummy instrument (and logical devices).
+                  The results can be compared with the baselines stored
+                  in benchmarks_baseline.json (one entry per computer, since
+                  the values depend on the machine). A computer without a
+                  baseline needs to store one first (with save_baseline,
+                  before the changes to measure).
+    To use, in pyHegel environment:
+        run -i benchmarks
+        res = run_all()        # or run_all(['get', 'sweep'], n=100)
+        compare(res)           # prints the comparison with the baseline
+        save_baseline(res)     # stores res as the baseline of this computer
+"""
+
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from pyHegel import commands, instruments
+from pyHegel.commands import get, set, getasync, snap, sweep, record
+
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks_baseline.json')
+
+# A result is slower/faster when the time per point changes by more than this fraction
+threshold = 0.1
+
+
+def _make_instruments():
+    d1 = instruments.dummy()
+    d2 = instruments.dummy()
+    d1.wait = 0.
+    d2.wait = 0.
+    scaled = instruments.ScalingDevice(d1.volt, 2.)
+    return d1, d2, scaled
+
+def bench_get(n, d1, d2, scaled):
+    for i in xrange(n):
+        get(d1.volt)
+
+def bench_get_logical(n, d1, d2, scaled):
+    for i in xrange(n):
+        get(scaled)
+
+def bench_set(n, d1, d2, scaled):
+    for i in xrange(n):
+        set(d1.volt, i)
+
+def bench_set_logical(n, d1, d2, scaled):
+    for i in xrange(n):
+        set(scaled, i)
+
+def bench_getasync(n, d1, d2, scaled):
+    for i in xrange(n):
+        getasync([d1.rand, d2.rand, scaled])
+
+def bench_readall_async(n, d1, d2, scaled):
+    devs = [d1.rand, d2.rand, scaled]
+    hdrs, graphsel, formats = commands._getheaders(getdevs=devs, root=sweep.path.get()+'/readall.txt', npts=n)
+    for i in xrange(n):
+        commands._readall_async(devs, formats, i)
+
+def bench_snap(n, d1, d2, scaled):
+    filename = os.path.join(sweep.path.get(), 'snap.txt')
+    for i in xrange(n):
+        snap(out=[d1.volt, d2.rand, scaled], filename=filename)
+    snap.close()
+
+def bench_sweep(n, d1, d2, scaled):
+    sweep(d1.volt, 0, 1, n, out=[d1.rand, d2.rand, scaled], filename='sweep.txt')
+
+def bench_sweep_async(n, d1, d2, scaled):
+    sweep(d1.volt, 0, 1, n, out=[d1.rand, d2.rand, scaled], filename='sweep_async.txt', async=True)
+
+def bench_record(n, d1, d2, scaled):
+    record([d1.rand, d2.rand, scaled], interval=0, npoints=n, filename='record.txt')
+
+benchmarks = [('get', bench_get), ('get_logical', bench_get_logical),
+              ('set', bench_set), ('set_logical', bench_set_logical),
+              ('getasync', bench_getasync), ('readall_async', bench_readall_async),
+              ('snap', bench_snap), ('sweep', bench_sweep), ('sweep_async', bench_sweep_async),
+              ('record', bench_record)]
+
+def run_all(names=None, n=200, repeat=3):
+    """
+       Runs the benchmarks (all of them or the ones in names) with n points,
+       repeat times, keeping the best one.
+       It returns a dictionnary name: dict(per_point_ms, points_per_s, n)
+       sweep and record are done without graph and with no waits.
+    """
+    d1, d2, scaled = _make_instruments()
+    old = sweep.path.get(), sweep.graph.get(), sweep.beforewait.get()
+    tmpdir = tempfile.mkdtemp(prefix='pyHegel_bench_')
+    sweep.path.set(tmpdir)
+    sweep.graph.set(False)
+    sweep.beforewait.set(0.)
+    results = {}
+    try:
+        for name, func in benchmarks:
+            if names is not None and name not in names:
+                continue
+            best = None
+            for r in range(repeat):
+                t0 = time.time()
+                func(n, d1, d2, scaled)
+                dt = time.time() - t0
+                if best is None or dt < best:
+                    best = dt
+            per_point = best/n
+            results[name] = dict(per_point_ms=per_point*1e3, points_per_s=1./per_point, n=n)
+            print '%-15s %12.3f ms/pt %12.1f pts/s'%(name, per_point*1e3, 1./per_point)
+    finally:
+        sweep.path.set(old[0])
+        sweep.graph.set(old[1])
+        sweep.beforewait.set(old[2])
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return results
+
+def _load_baselines():
+    if not os.path.exists(baseline_file):
+        return {}
+    with open(baseline_file) as f:
+        return json.load(f).get('machines', {})
+
+def save_baseline(results, machine=None, note=''):
+    """
+       Stores results (from run_all) as the baseline for machine
+       (defaults to the current computer name).
+       note is a description of the conditions of the measurement.
+    """
+    if machine is None:
+        machine = platform.node()
+    machines = _load_baselines()
+    machines[machine] = dict(date=time.strftime('%Y-%m-%d %H:%M:%S'),
+                             python=platform.python_version(),
+                             platform=platform.platform(),
+                             note=note,
+                             results=results)
+    with open(baseline_file, 'w') as f:
+        json.dump(dict(machines=machines), f, indent=1, sort_keys=True, separators=(',', ': '))
+        f.write('\n')
+
+def compare(results, machine=None):
+    """
+       Prints a comparison of results (from run_all) with the baseline
+       of machine (defaults to the current computer name).
+       Returns a dictionnary name: ratio of time per point (new/baseline)
+    """
+    baselines = _load_baselines()
+    if machine is None:
+        machine = platform.node()
+    base = baselines.get(machine)
+    if base is None:
+        print 'No baseline for %r. Use save_baseline first.'%machine
+        return {}
+    print 'Baseline from %s (python %s, %s)'%(base['date'], base['python'], base['platform'])
+    if base.get('note'):
+        print '   ', base['note']
+    print '%-15s %14s %14s %8s'%('benchmark', 'base (ms/pt)', 'new (ms/pt)', 'ratio')
+    ratios = {}
+    for name, func in benchmarks:
+        if name not in results:
+            continue
+        new = results[name]['per_point_ms']
+        old = base['results'].get(name)
+        if old is None:
+            print '%-15s %14s %14.3f %8s'%(name, '-', new, '-')
+            continue
+        old = old['per_point_ms']
+        ratio = new/old
+        ratios[name] = ratio
+        if ratio > 1+threshold:
+            flag = 'SLOWER'
+        elif ratio < 1-threshold:
+            flag = 'faster'
+        else:
+            flag = ''
+        print '%-15s %14.3f %14.3f %8.2f %s'%(name, old, new, ratio, flag)
+    return ratios
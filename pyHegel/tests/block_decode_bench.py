@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""
+    Binary block decoding benchmark: compares the time and the number of
+                  copies of the data for the decoding of large scpi binary
+                  blocks (#N<len><data>) done by slicing the string and using
+                  np.fromstring (the old method) and by the current
+                  _decode_block which uses np.frombuffer (a single copy,
+                  none when the block is in a writable buffer like a bytearray).
+    To use, in pyHegel environment:
+        run -i block_decode_bench
+        bench_decode() # or change some of the options
+"""
+
+import time
+import numpy as np
+from pyHegel.instruments_base import _decode_block, _decode_block_header, _encode_block
+
+
+def old_decode(s, t=np.float64):
+    """
+    The decoding as it was done before (slice then np.fromstring).
+    Returns the data and the number of copies of the data done.
+    """
+    copies = 0
+    sl, nb, nh = _decode_block_header(s)
+    block = s[sl]
+    copies += 1
+    if len(block) > nb:
+        block = block[:nb]
+        copies += 1
+    return np.fromstring(block, t), copies
+
+def new_decode(s, t=np.float64):
+    """
+    Returns the data and the number of copies (0 when the data
+    is a view of s, which only happens when s is writable).
+    """
+    v = _decode_block(s, t)
+    base = v
+    while base is not None and base is not s:
+        base = getattr(base, 'base', None)
+    return v, 0 if base is s else 1
+
+def make_block(nbytes, t=np.float64, term='\n'):
+    n = nbytes//np.dtype(t).itemsize
+    return _encode_block(np.arange(n, dtype=t)) + term
+
+def bench_one(func, s, t, repeat):
+    best = None
+    for i in range(repeat):
+        t0 = time.time()
+        v, copies = func(s, t)
+        dt = time.time() - t0
+        if best is None or dt < best:
+            best = dt
+    return best, copies, v
+
+def bench_decode(sizes_mb=[10, 30, 100], t=np.float64, repeat=5):
+    """
+       For every size (in MB) decodes a block (with a newline termination)
+       with the old and new method and prints the best time, the speed and
+       the number of copies of the data. The new method is also tried on
+       a bytearray (like the buffers filled by read_raw_into).
+    """
+    print '%8s %-5s %12s %12s %8s'%('size(MB)', 'mode', 'time (ms)', 'speed (MB/s)', 'copies')
+    for mb in sizes_mb:
+        s = make_block(int(mb*1e6), t)
+        res = []
+        for name, func, data in [('old', old_decode, s), ('new', new_decode, s),
+                                 ('new_b', new_decode, bytearray(s))]:
+            dt, copies, v = bench_one(func, data, t, repeat)
+            res.append(v)
+            speed = mb/dt if dt > 0 else np.inf
+            print '%8g %-5s %12.3f %12.1f %8i'%(mb, name, dt*1e3, speed, copies)
+        if not (np.array_equal(res[0], res[1]) and np.array_equal(res[0], res[2])):
+            print 'ERROR: the decoded data differ for %g MB'%mb
+        del s, res
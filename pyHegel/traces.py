@@ -350,6 +350,9 @@ def _offsetText_helper(self):
     self.offsetText.xytext = (x+self._offsetText_xshift, y)
 
 class Trace(TraceBase):
+    # Maximum number of redraws per second when adding points. The points
+    # added in between are shown on the next redraw.
+    max_fps = 10.
     def __init__(self, width=9.00, height=7.00, dpi=72, time_mode = False):
         super(Trace, self).__init__(width=width, height=height, dpi=dpi)
         ax = host_subplot_class(self.fig, 111)
@@ -363,6 +366,13 @@ class Trace(TraceBase):
         self.legend_strs = None
         self.first_update = True
         self.time_mode = time_mode
+        # xs and ys are views on these buffers which are grown by doubling their size
+        self._xbuf = None
+        self._ybuf = None
+        self._npts = 0
+        self._last_update = 0.
+        self._update_pending = False
+        self._legend_changed = True
         # could also use self.fig.autofmt_xdate()
         ax = self.axs[0]
         tlabels = ax.axis['bottom'].major_ticklabels
@@ -425,28 +435,52 @@ class Trace(TraceBase):
         if self.time_mode:
             # convert from sec since epoch to matplotlib date format
             x = time2date(x)
-        if self.xs == None:
-            self.xs = np.array([x])
-        else:  self.xs = np.append(self.xs, x)
-        if self.ys == None:
-            self.ys = np.array([ys])
-        else:  self.ys = np.append(self.ys, [ys], axis=0)
-        self.update()
+        n = self._npts
+        if n == 0:
+            ys = np.asarray(ys, dtype=float)
+            self._xbuf = np.empty(1024)
+            self._ybuf = np.empty((1024, ys.size))
+        elif n == len(self._xbuf):
+            xbuf = np.empty(2*n)
+            xbuf[:n] = self._xbuf
+            ybuf = np.empty((2*n, self._ybuf.shape[1]))
+            ybuf[:n] = self._ybuf
+            self._xbuf = xbuf
+            self._ybuf = ybuf
+        self._xbuf[n] = x
+        self._ybuf[n] = ys
+        self._npts = n+1
+        self.xs = self._xbuf[:n+1]
+        self.ys = self._ybuf[:n+1]
+        self.update_throttled()
     def setPoints(self, x, y):
         if self.time_mode:
             # convert from sec since epoch to matplotlib date format
             x = time2date(x)
-        self.xs = np.array(x)
-        self.ys = np.array(y.T)
+        self.xs = self._xbuf = np.array(x, dtype=float)
+        self.ys = self._ybuf = np.array(y.T, dtype=float)
+        self._npts = len(self.xs)
         self.update()
+    def clearPoints(self):
+        """
+        Removes all the data points but keeps the figure (axes, legend, limits)
+        so it can be reused for a new set of points.
+        """
+        self._npts = 0
+        self.xs = None
+        self.ys = None
+        for crv in getattr(self, 'crvs', []):
+            crv.set_data([], [])
+        self.draw()
     def setlegend(self, str_lst):
         self.legend_strs = str_lst
+        self._legend_changed = True
         self.update()
     def windowResize(self, event):
         self.canvas_resizeEvent_orig(event)
         self.do_resize()
     def do_resize(self, draw=True):
-        if self.xs == None:
+        if self.xs is None:
             return
         ndim = self.ys.shape[1]
         offset = self.offset
@@ -457,8 +491,31 @@ class Trace(TraceBase):
         self.fig.subplots_adjust(left=rel_dx*1.5, right=right)
         if draw:
             self.draw()
+    def update_throttled(self):
+        """
+        Same as update, but limits the number of redraws to max_fps per second.
+        When called too soon, the redraw is delayed (and combined with the
+        following calls).
+        """
+        if self._update_pending:
+            return
+        delay = self._last_update + 1./self.max_fps - time.time()
+        if delay <= 0:
+            self.update()
+        else:
+            self._update_pending = True
+            QtCore.QTimer.singleShot(int(delay*1000)+1, self._pending_update)
+    def _pending_update(self):
+        if self._update_pending and not self.isclosed:
+            self.update()
+    def close_slot(self):
+        # a delayed update (from update_throttled) is dropped once closed
+        self._update_pending = False
+        return super(Trace, self).close_slot()
     def update(self):
-        if self.xs == None:
+        self._update_pending = False
+        self._last_update = time.time()
+        if self.xs is None:
             self.draw()
             return
         if self.first_update:
@@ -506,7 +563,10 @@ class Trace(TraceBase):
                 self.crvs.append(plt)
             else:
                 self.crvs[i].set_data(x, y)
-        self.axs[0].legend(loc='upper left', bbox_to_anchor=(0, 1.10)).draggable()
+        if self._legend_changed or self.first_update:
+            # The legend does not change with the data, so only rebuild it when needed.
+            self.axs[0].legend(loc='upper left', bbox_to_anchor=(0, 1.10)).draggable()
+            self._legend_changed = False
         for ax in self.axs:
             ax.relim()
             ax.autoscale(enable=None)
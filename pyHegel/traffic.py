@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+########################## Copyrights and license ############################
+#                                                                            #
+# Copyright 2011-2015  Christian Lupien <christian.lupien@usherbrooke.ca>    #
+#                                                                            #
+# This file is part of pyHegel.  http://github.com/lupien/pyHegel            #
+#                                                                            #
+# pyHegel is free software: you can redistribute it and/or modify it under   #
+# the terms of the GNU Lesser General Public License as published by the     #
+# Free Software Foundation, either version 3 of the License, or (at your     #
+# option) any later version.                                                 #
+#                                                                            #
+# pyHegel is distributed in the hope that it will be useful, but WITHOUT     #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or      #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public        #
+# License for more details.                                                  #
+#                                                                            #
+# You should have received a copy of the GNU Lesser General Public License   #
+# along with pyHegel.  If not, see <http://www.gnu.org/licenses/>.           #
+#                                                                            #
+##############################################################################
+
+"""
+Recorder of the instrument traffic (write, read, ask).
+
+When enabled, every operation is stored in a fixed size ring buffer
+(the last size operations are kept) with its start time, duration,
+instrument, command and answer size. Nothing is formatted while recording,
+that is only done by dump and summary.
+Use the pyHegel commands traffic_enable, traffic_summary, traffic_dump and
+traffic_clear.
+"""
+
+from __future__ import absolute_import
+
+import itertools
+import threading
+import time
+import weakref
+
+enabled = False
+
+def _alloc(size):
+    global _buffers
+    # All the buffers are replaced at once (a single assignment) and record
+    # and entries read _buffers only once, so a set_size or clear done
+    # while recording from another thread cannot mix buffers of different
+    # sizes. next() on itertools.count is atomic (under the GIL), so no
+    # lock is needed.
+    _buffers = (size, itertools.count(), [-1]*size, [0.]*size, [0.]*size,
+                [None]*size, [None]*size, [None]*size, [0]*size)
+
+_alloc(10000)
+
+_local = threading.local()
+
+def set_size(size):
+    """ Changes the size of the ring buffer. This clears it. """
+    _alloc(size)
+
+def get_size():
+    return _buffers[0]
+
+def clear():
+    _alloc(get_size())
+
+def record(instr, op, cmd, t0, t1, nbytes=0):
+    """
+    Stores an operation op ('write', 'read', 'ask') of instrument instr
+    that started at t0 and ended at t1. cmd is the command (kept as is).
+    nbytes is the size of the answer (or of the command for write)
+    """
+    size, counter, seq, start, duration, instrs, ops, cmds, nbytess = _buffers
+    n = next(counter)
+    i = n % size
+    seq[i] = n
+    start[i] = t0
+    duration[i] = t1 - t0
+    instrs[i] = weakref.ref(instr)
+    ops[i] = op
+    cmds[i] = cmd
+    nbytess[i] = nbytes
+
+class _InAsk(object):
+    """
+    Context manager used around ask so the write and read it contains are
+    not recorded separately (only the ask is).
+    """
+    def __enter__(self):
+        _local.in_ask = getattr(_local, 'in_ask', 0) + 1
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        _local.in_ask -= 1
+
+in_ask = _InAsk()
+
+def is_in_ask():
+    return getattr(_local, 'in_ask', 0) > 0
+
+def _instr_name(ref):
+    instr = ref() if ref is not None else None
+    if instr is None:
+        return '<deleted>'
+    try:
+        return instr.find_global_name()
+    except AttributeError:
+        return repr(instr)
+
+def _cmd_str(cmd):
+    if cmd is None:
+        return ''
+    if isinstance(cmd, basestring):
+        return cmd.rstrip('\r\n')
+    return repr(cmd)
+
+def entries():
+    """
+    Returns the operations in the buffer, oldest first, as a list of
+    (start_time, duration, instrument_name, op, command, nbytes)
+    """
+    size, counter, seq, start, duration, instrs, ops, cmds, nbytess = _buffers
+    order = sorted((i for i in xrange(size) if seq[i] >= 0), key=seq.__getitem__)
+    names = {}
+    ret = []
+    for i in order:
+        ref = instrs[i]
+        if ref not in names:
+            names[ref] = _instr_name(ref)
+        ret.append((start[i], duration[i], names[ref], ops[i], _cmd_str(cmds[i]), nbytess[i]))
+    return ret
+
+def dump(filename):
+    """
+    Writes all the buffer operations to filename (tab separated columns)
+    """
+    with open(filename, 'w') as f:
+        f.write('#time\tduration_ms\tinstrument\top\tnbytes\tcommand\n')
+        for t, dt, name, op, cmd, nb in entries():
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t)) + ('%.6f'%(t%1))[1:]
+            f.write('%s\t%.3f\t%s\t%s\t%i\t%r\n'%(ts, dt*1e3, name, op, nb, cmd))
+
+def _header(cmd):
+    # The command without its arguments: 'VOLT 1' -> 'VOLT', 'FETCH? 1' -> 'FETCH?'
+    return cmd.split(' ', 1)[0].upper()
+
+def aggregate():
+    """
+    Returns a dict (instrument_name, op, command_header): (count, total_time, max_time, total_bytes)
+    for the operations in the buffer.
+    """
+    ret = {}
+    for t, dt, name, op, cmd, nb in entries():
+        key = (name, op, _header(cmd))
+        c, tot, mx, b = ret.get(key, (0, 0., 0., 0))
+        ret[key] = (c+1, tot+dt, max(mx, dt), b+nb)
+    return ret
+
+def summary(n=20, sort='total'):
+    """
+    Prints the n commands with the largest sort ('total', 'count', 'mean', 'max' or 'bytes')
+    """
+    agg = aggregate()
+    keys = dict(count=lambda v: v[0], total=lambda v: v[1], mean=lambda v: v[1]/v[0],
+                max=lambda v: v[2], bytes=lambda v: v[3])[sort]
+    items = sorted(agg.items(), key=lambda kv: keys(kv[1]), reverse=True)
+    if n is not None:
+        items = items[:n]
+    print '%-20s %-5s %-25s %7s %10s %9s %9s %10s'%('instrument', 'op', 'command', 'count', 'total(s)',
+                                                  'mean(ms)', 'max(ms)', 'bytes')
+    for (name, op, hdr), (c, tot, mx, b) in items:
+        print '%-20s %-5s %-25s %7i %10.3f %9.3f %9.3f %10i'%(name[:20], op, hdr[:25], c, tot,
+                                                            tot/c*1e3, mx*1e3, b)
@@ -120,6 +120,52 @@ def loadtxt_csv(filename, dtype=float, unpack=False, ndmin=0):
 _readfile_lastnames = []
 _readfile_lastheaders = []
 _readfile_lasttitles = []
+
+##################################################
+# Binary data files (sweep, record with binary=True)
+#  They start with the same text headers (lines starting with #) as the text
+#  files, followed by a line
+#      #pyHegel_binary_data: dtype=<f8 ncols=N
+#  and then the raw data, row after row (N values per row). Data is only
+#  ever appended (in chunks) to the end of the file so it can be read
+#  while it is being written.
+
+_binary_data_marker = '#pyHegel_binary_data:'
+_binary_data_dtype = '<f8'
+
+def _binary_data_header(ncols, dtype=_binary_data_dtype):
+    return '%s dtype=%s ncols=%i\n'%(_binary_data_marker, np.dtype(dtype).str, ncols)
+
+def _binary_data_info(filename):
+    """
+    Checks if the file is a pyHegel binary data file.
+    Returns None if not, otherwise returns (offset, dtype, ncols)
+    with offset the position of the start of data.
+    """
+    with open(filename, 'rb') as f:
+        while True:
+            line = f.readline()
+            if not line.startswith('#'):
+                return None
+            if line.startswith(_binary_data_marker):
+                info = dict([v.split('=') for v in line[len(_binary_data_marker):].split()])
+                return f.tell(), np.dtype(info['dtype']), int(info['ncols'])
+
+def _read_binary_data(filename, info=None):
+    """
+    Returns the data of a binary data file as a read only memory map
+    of shape (ncols, nrows). An incomplete last row (file still being written)
+    is skipped.
+    """
+    if info is None:
+        info = _binary_data_info(filename)
+    offset, dtype, ncols = info
+    row_size = dtype.itemsize*ncols
+    nrows = (os.path.getsize(filename) - offset)//row_size
+    if nrows == 0:
+        return np.zeros((ncols, 0), dtype=dtype)
+    data = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=(nrows, ncols))
+    return data.T
 def readfile(filename, prepend=None, getnames=False, getheaders=False, csv='auto', dtype=None):
     """
     This function will return a numpy array containing all the data in the
@@ -155,6 +201,10 @@ def readfile(filename, prepend=None, getnames=False, getheaders=False, csv='auto
     If the file extension ends with .npy, it is read with np.load as a numpy
     file.
 
+    The binary data files (from sweep or record with binary=True) are
+    detected automatically. For a single file, the data is then a memory map
+    of the file (so it is not loaded in memory until needed).
+
     The list of files is saved in the global variable _readfile_lastnames.
     When the parameter getnames=True, the return value is a tuple
     (array, filenames_list)
@@ -192,7 +242,7 @@ def readfile(filename, prepend=None, getnames=False, getheaders=False, csv='auto
         with open(filelist[0], 'rU') as f: # only the first file
             while True:
                 line = f.readline()
-                if line[0] != '#':
+                if line[0] != '#' or line.startswith(_binary_data_marker):
                     break
                 hdrs.append(line)
         if len(hdrs): # at least one line, we use the last one, strip start # and end newline
@@ -207,6 +257,10 @@ def readfile(filename, prepend=None, getnames=False, getheaders=False, csv='auto
         if fn.lower().endswith('.npy'):
             ret.append(np.load(fn))
             continue
+        bin_info = _binary_data_info(fn)
+        if bin_info is not None:
+            ret.append(_read_binary_data(fn, bin_info))
+            continue
         if csv=='auto':
             if fn.lower().endswith('.csv'):
                 docsv = True
@@ -0,0 +1,740 @@
+# -*- coding: utf-8 -*-
+
+########################## Copyrights and license ############################
+#                                                                            #
+# Copyright 2011-2015  Christian Lupien <christian.lupien@usherbrooke.ca>    #
+#                                                                            #
+# This file is part of pyHegel.  http://github.com/lupien/pyHegel            #
+#                                                                            #
+# pyHegel is free software: you can redistribute it and/or modify it under   #
+# the terms of the GNU Lesser General Public License as published by the     #
+# Free Software Foundation, either version 3 of the License, or (at your     #
+# option) any later version.                                                 #
+#                                                                            #
+# pyHegel is distributed in the hope that it will be useful, but WITHOUT     #
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or      #
+# FITNESS FOR A PARTICULAR PURPOSE. See the GNU Lesser General Public        #
+# License for more details.                                                  #
+#                                                                            #
+# You should have received a copy of the GNU Lesser General Public License   #
+# along with pyHegel.  If not, see <http://www.gnu.org/licenses/>.           #
+#                                                                            #
+##############################################################################
+
+"""
+Simulated VISA instruments.
+
+This provides a resource manager with the same interface as the ones of
+visa_wrap (open_resource, list_resources ...) but where the instruments are
+python objects (SimDevice). It needs neither a visa library nor hardware, so
+it can be used to test and benchmark the code of visaInstrument,
+visaInstrumentAsync, sweep ...
+
+A SimDevice answers SCPI messages using the handlers added with add_query and
+add_command (regular expressions). It handles the common 488.2 commands
+(*IDN?, *OPC, *ESR? ...), SYSTem:ERRor? and, for unknown headers, simply
+remembers the value written ('FREQ 10' then 'FREQ?' returns '10').
+The timing is simulated with LatencyModel:
+   - query_latency: the time for the instrument to produce an answer
+   - transfer: the time the bus is used for a write or a read (all the
+               instruments on the same GPIB board share the bus, so their
+               transfers are serialized)
+Commands can make the instrument busy (busy option of add_command), which
+delays *OPC? and the SRQ produced by *OPC (when enabled with *ESE 1;*SRE 32).
+
+For example:
+    import random
+    from pyHegel import visa_sim, instruments_base
+    from pyHegel.instruments import agilent
+    dev = visa_sim.SimDevice('Agilent Technologies,34410A,MY00000000,2.35-2.35-0.09-46-09',
+                             query_latency=visa_sim.LatencyModel(2e-3))
+    dev.add_query(r'(READ|FETC[H]?)\\?', lambda dev, m: '%.8e'%random.random())
+    dev.add_query(r'VOLT:APER\\? (MAX|MIN)', lambda dev, m: '1' if m.group(1).upper() == 'MAX' else '1e-5')
+    dev.add_command(r'INIT(IATE)?', busy=0.1)
+    visa_sim.add_instrument('GPIB0::22', dev)
+    instruments_base._load_resource_manager('sim')
+    dmm = agilent.agilent_multi_34410A(22)
+"""
+
+from __future__ import absolute_import
+
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+class _Constants(object):
+    """ The visa constants needed by pyHegel (used when pyvisa is not available) """
+    VI_SUCCESS = 0
+    VI_SUCCESS_MAX_CNT = 0x3FFF0006
+    VI_ERROR_TMO = -1073807339               # 0xBFFF0015
+    VI_ERROR_RSRC_LOCKED = -1073807345       # 0xBFFF000F
+    VI_ERROR_RSRC_NFOUND = -1073807343       # 0xBFFF0011
+    VI_ERROR_SESN_NLOCKED = -1073807204      # 0xBFFF009C
+    VI_EVENT_SERVICE_REQ = 0x3FFF200B
+    VI_ALL_ENABLED_EVENTS = 0x3FFF7FFF
+    VI_QUEUE = 1
+    VI_HNDLR = 2
+    VI_SUSPEND_HNDLR = 4
+    VI_ALL_MECH = 0xFFFF
+    VI_TMO_IMMEDIATE = 0
+    VI_TMO_INFINITE = 0xFFFFFFFF
+    VI_EXCLUSIVE_LOCK = 1
+    VI_SHARED_LOCK = 2
+    VI_ATTR_MANF_NAME = -1073807246          # 0xBFFF0072
+    VI_ATTR_MODEL_NAME = -1073807241         # 0xBFFF0077
+    VI_ATTR_USB_SERIAL_NUM = -1073806944     # 0xBFFF01A0
+    VI_ATTR_GPIB_SRQ_STATE = 0x3FFF0167
+    VI_GPIB_REN_DEASSERT = 0
+    VI_GPIB_REN_ASSERT = 1
+    VI_GPIB_REN_DEASSERT_GTL = 2
+    VI_GPIB_REN_ASSERT_ADDRESS = 3
+    VI_GPIB_REN_ASSERT_LLO = 4
+    VI_GPIB_REN_ASSERT_ADDRESS_LLO = 5
+    VI_GPIB_REN_ADDRESS_GTL = 6
+
+constants = _Constants()
+
+class VisaIOError(Exception):
+    """ Used instead of the pyvisa one when pyvisa is not available """
+    def __init__(self, error_code):
+        super(VisaIOError, self).__init__('Visa error code %i'%error_code)
+        self.error_code = error_code
+
+def _visa_wrap():
+    # imported here to prevent cyclic import problems
+    # (visa_wrap uses this module when pyvisa is missing)
+    from . import visa_wrap
+    return visa_wrap
+
+def _error(code_name):
+    vw = _visa_wrap()
+    code = getattr(vw.constants, code_name)
+    if vw.pyvisa is None:
+        return VisaIOError(code)
+    return vw.VisaIOError(code)
+
+def _const(name):
+    return getattr(_visa_wrap().constants, name)
+
+
+#######################################################
+##    Latency and bus models
+#######################################################
+
+class LatencyModel(object):
+    """
+    The time in s for an operation transferring nbytes is:
+        base + per_byte*nbytes + uniform(0, jitter)
+    """
+    def __init__(self, base=0., per_byte=0., jitter=0.):
+        self.base = base
+        self.per_byte = per_byte
+        self.jitter = jitter
+    def __call__(self, nbytes=0):
+        t = self.base + self.per_byte*nbytes
+        if self.jitter:
+            t += random.uniform(0, self.jitter)
+        return t
+    def __repr__(self):
+        return 'LatencyModel(base=%r, per_byte=%r, jitter=%r)'%(self.base, self.per_byte, self.jitter)
+
+# About 1 MB/s for GPIB, with a small overhead per transfer.
+gpib_transfer = LatencyModel(base=200e-6, per_byte=1e-6)
+# For USB and LAN.
+fast_transfer = LatencyModel(base=100e-6, per_byte=10e-9)
+
+class SimBus(object):
+    """
+    A bus can only do one transfer at a time. All the instruments on
+    the same GPIB board share a bus. Other instruments have their own.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.busy_time = 0.
+    def transfer(self, duration):
+        with self.lock:
+            if duration > 0:
+                time.sleep(duration)
+            self.busy_time += duration
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+def _get_bus(name):
+    with _buses_lock:
+        if name not in _buses:
+            _buses[name] = SimBus(name)
+        return _buses[name]
+
+
+#######################################################
+##    Simulated instrument
+#######################################################
+
+def encode_block(data):
+    """
+    Returns the scpi binary block (#niii...data) of data, which can be
+    a string or a numpy array.
+    """
+    if isinstance(data, np.ndarray):
+        data = data.tostring()
+    n = str(len(data))
+    return '#%i%s%s'%(len(n), n, data)
+
+def _split_message(message):
+    """
+    Splits a SCPI message on the ; that are not in quotes or in a binary block.
+    """
+    parts = []
+    start = 0
+    i = 0
+    n = len(message)
+    while i < n:
+        c = message[i]
+        if c in '"\'':
+            end = message.find(c, i+1)
+            i = n if end == -1 else end+1
+            continue
+        if c == '#' and i+1 < n and message[i+1] in '123456789':
+            nh = int(message[i+1])
+            try:
+                nb = int(message[i+2:i+2+nh])
+            except ValueError:
+                nb = 0
+            i += 2 + nh + nb
+            continue
+        if c == ';':
+            parts.append(message[start:i])
+            start = i+1
+        i += 1
+    parts.append(message[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+class SimDevice(object):
+    """
+    A simulated SCPI instrument.
+    idn:           the answer to *IDN?
+    query_latency: LatencyModel for the processing time of a query
+                   (nbytes is the length of the answer)
+    transfer:      LatencyModel for the bus use of every write/read
+                   (defaults to gpib_transfer for GPIB, fast_transfer otherwise)
+    settings:      a dictionnary of header:value (strings) for the initial values
+                   of the remembered settings (they are restored by *RST).
+    attributes:    a dictionnary of visa attributes (for get_visa_attribute)
+    """
+    def __init__(self, idn='pyHegel,SimDevice,0,1.0', query_latency=None, transfer=None,
+                 settings={}, attributes={}):
+        self.idn = idn
+        self.query_latency = query_latency if query_latency is not None else LatencyModel()
+        self.transfer = transfer
+        self._initial_settings = dict((k.upper(), v) for k, v in settings.items())
+        self.settings = dict(self._initial_settings)
+        self.attributes = dict(attributes)
+        self._queries = []
+        self._commands = []
+        self._lock = threading.RLock()
+        self._sessions = []
+        self._output = ''
+        self._output_ready = 0.
+        self._busy_until = 0.
+        self._opc_timer = None
+        self.errors = []
+        self.esr = 0
+        self.ese = 0
+        self.sre = 0
+        self.stb_extra = 0
+        self._rqs = False
+        self._lock_cond = threading.Condition(threading.Lock())
+        self._lock_owner = None
+        self.bus = None
+        self.n_writes = 0
+        self.n_reads = 0
+    def __repr__(self):
+        return '<SimDevice %r>'%self.idn
+    # handlers
+    def add_query(self, pattern, response=None, latency=None):
+        """
+        pattern is a regular expression (case insensitive) that needs to match
+        the full query (without the leading :).
+        response can be a string or a function(dev, match) returning a string
+        (use encode_block for binary answers).
+        latency, if given, is a LatencyModel that replaces query_latency.
+        """
+        self._queries.insert(0, (re.compile(pattern+'$', re.IGNORECASE), response, latency))
+    def add_command(self, pattern, func=None, busy=0.):
+        """
+        pattern is a regular expression (case insensitive) that needs to match
+        the full command (without the leading :).
+        func, if given, is called as func(dev, match).
+        busy is the time (s) the instrument is busy after the command
+        (it delays *OPC? and the *OPC event).
+        """
+        self._commands.insert(0, (re.compile(pattern+'$', re.IGNORECASE), func, busy))
+    # status handling
+    def status_byte(self, serial_poll=False):
+        stb = self.stb_extra & ~0x60
+        if self.esr & self.ese:
+            stb |= 0x20
+        if serial_poll:
+            if self._rqs:
+                stb |= 0x40
+            self._rqs = False
+        elif stb & self.sre:
+            stb |= 0x40
+        return stb
+    def _update_srq(self):
+        stb = self.status_byte()
+        if stb & self.sre & ~0x40 and not self._rqs:
+            self._rqs = True
+            for s in list(self._sessions):
+                s._srq()
+    def set_esr(self, bits):
+        with self._lock:
+            self.esr |= bits
+            self._update_srq()
+    def _do_opc(self):
+        with self._lock:
+            self._opc_timer = None
+        self.set_esr(0x01)
+    def _busy_left(self):
+        return max(0., self._busy_until - time.time())
+    # message processing
+    def _process_one(self, cmd):
+        # returns (answer or None, processing time)
+        if cmd.startswith(':'):
+            cmd = cmd[1:]
+        is_query = cmd.split(' ', 1)[0].endswith('?')
+        if is_query:
+            for regex, response, latency in self._queries:
+                m = regex.match(cmd)
+                if m:
+                    if callable(response):
+                        response = response(self, m)
+                    if latency is None:
+                        latency = self.query_latency
+                    return response, latency(len(response))
+        else:
+            for regex, func, busy in self._commands:
+                m = regex.match(cmd)
+                if m:
+                    if func is not None:
+                        func(self, m)
+                    if busy:
+                        self._busy_until = max(self._busy_until, time.time()) + busy
+                    return None, 0.
+        return self._builtin(cmd, is_query)
+    def _builtin(self, cmd, is_query):
+        header = cmd.split(' ', 1)
+        arg = header[1].strip() if len(header) > 1 else ''
+        header = header[0].upper()
+        latency = self.query_latency
+        if header == '*IDN?':
+            return self.idn, latency(len(self.idn))
+        elif header == '*OPC?':
+            return '1', self._busy_left() + latency(1)
+        elif header == '*OPC':
+            left = self._busy_left()
+            if left > 0:
+                if self._opc_timer is None:
+                    self._opc_timer = threading.Timer(left, self._do_opc)
+                    self._opc_timer.daemon = True
+                    self._opc_timer.start()
+            else:
+                self.esr |= 0x01
+                self._update_srq()
+        elif header == '*ESR?':
+            ret = str(self.esr)
+            self.esr = 0
+            return ret, latency(len(ret))
+        elif header == '*STB?':
+            ret = str(self.status_byte())
+            return ret, latency(len(ret))
+        elif header in ['*ESE?', '*SRE?']:
+            ret = str(self.ese if header == '*ESE?' else self.sre)
+            return ret, latency(len(ret))
+        elif header == '*ESE':
+            self.ese = int(arg)
+            self._update_srq()
+        elif header == '*SRE':
+            self.sre = int(arg)
+            self._update_srq()
+        elif header == '*CLS':
+            self.esr = 0
+            self.errors = []
+            self._rqs = False
+        elif header == '*RST':
+            self.settings = dict(self._initial_settings)
+        elif header in ['*WAI', '*TRG']:
+            pass
+        elif header in ['SYST:ERR?', 'SYSTEM:ERROR?', 'SYST:ERR:NEXT?', 'SYSTEM:ERROR:NEXT?']:
+            if self.errors:
+                ret = self.errors.pop(0)
+            else:
+                ret = '+0,"No error"'
+            return ret, latency(len(ret))
+        elif is_query:
+            key = header[:-1]
+            if key in self.settings:
+                ret = self.settings[key]
+                return ret, latency(len(ret))
+            self.errors.append('-113,"Undefined header"')
+            # no answer, the read will timeout
+            return '', latency(0)
+        else:
+            self.settings[header] = arg
+        return None, 0.
+    def process(self, message):
+        """
+        Handles a written message. It returns the answer (None if there
+        was no query) and the processing time.
+        """
+        with self._lock:
+            self.n_writes += 1
+            answers = []
+            total = 0.
+            for cmd in _split_message(message):
+                ans, t = self._process_one(cmd)
+                total += t
+                if ans is not None and ans != '':
+                    answers.append(ans)
+            if not answers:
+                return None, total
+            return ';'.join(answers), total
+    def clear(self):
+        """ device clear: empties the output buffer """
+        with self._lock:
+            self._output = ''
+            self._output_ready = 0.
+
+
+#######################################################
+##    Visa like session and resource manager
+#######################################################
+
+def _normalize_addr(addr):
+    addr = addr.upper()
+    split = [s for s in addr.split('::')]
+    if split[-1] == 'INSTR':
+        del split[-1]
+    if split[0] in ['GPIB', 'USB', 'TCPIP', 'ASRL']:
+        split[0] += '0'
+    if split[0].startswith('USB') or split[0].startswith('GPIB'):
+        # remove the optional interface number (::0) and use decimal numbers
+        if split[0].startswith('USB') and len(split) == 5 and split[-1] == '0':
+            del split[-1]
+        split = [split[0]] + [str(int(s, 0)) if re.match(r'(0X[0-9A-F]+|[0-9]+)$', s) else s for s in split[1:]]
+    return '::'.join(split)
+
+class SimResource(object):
+    """
+    This is the session to a SimDevice. It provides the same methods
+    as the visa_wrap instruments.
+    """
+    def __init__(self, manager, resource_name, device, timeout=2000,
+                 read_termination=None, write_termination='\n', **kwargs):
+        self.resource_manager = manager
+        self.resource_name = resource_name
+        self.device = device
+        self.timeout = timeout
+        self.read_termination = read_termination
+        self.write_termination = write_termination
+        for k, v in kwargs.items():
+            setattr(self, k, v)
+        self._interface = resource_name.split('::')[0].rstrip('0123456789')
+        if device.bus is None:
+            if self._interface == 'GPIB':
+                device.bus = _get_bus(resource_name.split('::')[0])
+            else:
+                device.bus = _get_bus(resource_name)
+        if device.transfer is None:
+            device.transfer = gpib_transfer if self._interface == 'GPIB' else fast_transfer
+        self._events_cond = threading.Condition(threading.Lock())
+        self._events = []
+        self._srq_mech = 0
+        self._handlers = []
+        self._lock_count = 0
+        self._closed = False
+        device._sessions.append(self)
+    def __repr__(self):
+        return '<SimResource %s>'%self.resource_name
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            try:
+                self.device._sessions.remove(self)
+            except ValueError:
+                pass
+    def __del__(self):
+        self.close()
+    def is_serial(self):
+        return self._interface == 'ASRL'
+    def is_gpib(self):
+        return self._interface == 'GPIB'
+    def is_usb(self):
+        return self._interface == 'USB'
+    # communication
+    def _timeout_s(self):
+        if self.timeout is None:
+            return None
+        return self.timeout/1000.
+    def write_raw(self, message):
+        dev = self.device
+        dev.bus.transfer(dev.transfer(len(message)))
+        ans, proc_time = dev.process(message)
+        if ans is not None:
+            with dev._lock:
+                dev._output += ans + '\n'
+                dev._output_ready = time.time() + proc_time
+    def write(self, message, termination='default'):
+        termination = self.write_termination if termination == 'default' else termination
+        if termination and not message.endswith(termination):
+            message += termination
+        self.write_raw(message)
+    def _wait_output(self):
+        dev = self.device
+        to = self._timeout_s()
+        start = time.time()
+        while True:
+            with dev._lock:
+                has_data = dev._output != ''
+                left = dev._output_ready - time.time()
+            if has_data and left <= 0:
+                return
+            if not has_data:
+                left = 0.001
+            if to is not None and time.time() - start + left > to:
+                if to > 0:
+                    time.sleep(max(0., to - (time.time()-start)))
+                raise _error('VI_ERROR_TMO')
+            time.sleep(left)
+    def read_raw_n(self, size):
+        """ Returns at most size bytes of the answer """
+        self._wait_output()
+        dev = self.device
+        with dev._lock:
+            ret = dev._output[:size]
+            dev._output = dev._output[size:]
+            dev.n_reads += 1
+        dev.bus.transfer(dev.transfer(len(ret)))
+        return ret
+    def read_raw_n_end(self, size):
+        """ Same as read_raw_n but returns (data, ended), ended is True when all the answer was read """
+        data = self.read_raw_n(size)
+        with self.device._lock:
+            return data, self.device._output == ''
+    def read_raw_into(self, buf, offset=0, size=None):
+        """ Same as read_raw_n but puts the data in buf (bytearray or numpy array) at offset.
+            Returns the number of bytes read. """
+        if size is None:
+            size = len(buf) - offset
+        data = self.read_raw_n(size)
+        memoryview(buf)[offset:offset+len(data)] = data
+        return len(data)
+    def read_raw(self, size=None):
+        self._wait_output()
+        dev = self.device
+        with dev._lock:
+            ret = dev._output
+            dev._output = ''
+            dev.n_reads += 1
+        dev.bus.transfer(dev.transfer(len(ret)))
+        return ret
+    def read(self, termination='default'):
+        termination = self.read_termination if termination == 'default' else termination
+        ret = self.read_raw()
+        if termination and ret.endswith(termination):
+            return ret[:-len(termination)]
+        if ret.endswith('\r\n'):
+            return ret[:-2]
+        elif ret[-1:] in ('\r', '\n'):
+            return ret[:-1]
+        return ret
+    def query(self, message, raw=False):
+        self.write(message)
+        if raw:
+            return self.read_raw()
+        return self.read()
+    def clear(self):
+        self.device.clear()
+    def trigger(self):
+        self.device.process('*TRG')
+    def control_ren(self, mode):
+        pass
+    def read_stb(self):
+        dev = self.device
+        dev.bus.transfer(dev.transfer(1))
+        with dev._lock:
+            stb = dev.status_byte(serial_poll=True)
+            if dev._output:
+                stb |= 0x10 # MAV
+            return stb
+    # attributes
+    def get_visa_attribute(self, attr):
+        if attr == _const('VI_ATTR_GPIB_SRQ_STATE'):
+            return self.device._rqs
+        return self.device.attributes.get(attr)
+    def set_visa_attribute(self, attr, state):
+        self.device.attributes[attr] = state
+    # locking (only within this process)
+    def lock_excl(self, timeout_ms='default'):
+        timeout_ms = self.timeout if timeout_ms == 'default' else timeout_ms
+        dev = self.device
+        cond = dev._lock_cond
+        if timeout_ms is None:
+            end = float('inf')
+        else:
+            end = time.time() + timeout_ms/1000.
+        with cond:
+            while True:
+                owner = dev._lock_owner
+                if owner is None or owner is self:
+                    dev._lock_owner = self
+                    self._lock_count += 1
+                    return
+                left = end - time.time()
+                if left <= 0:
+                    raise _error('VI_ERROR_TMO')
+                cond.wait(min(left, 1.))
+    def lock(self, timeout_ms='default', requested_key=None):
+        self.lock_excl(timeout_ms)
+        return requested_key
+    def unlock(self):
+        dev = self.device
+        cond = dev._lock_cond
+        with cond:
+            if dev._lock_owner is not self or self._lock_count == 0:
+                raise _error('VI_ERROR_SESN_NLOCKED')
+            self._lock_count -= 1
+            if self._lock_count == 0:
+                dev._lock_owner = None
+                cond.notify_all()
+    # events
+    def _srq(self):
+        # Called by the device when it requests service.
+        srq = _const('VI_EVENT_SERVICE_REQ')
+        if self._srq_mech & _const('VI_QUEUE'):
+            with self._events_cond:
+                self._events.append(srq)
+                self._events_cond.notify_all()
+        if self._srq_mech & _const('VI_HNDLR'):
+            for event_type, handler, user_handle in list(self._handlers):
+                if event_type == srq:
+                    # visa calls the handlers in a separate thread
+                    th = threading.Thread(target=handler, args=(self, srq, None, user_handle))
+                    th.daemon = True
+                    th.start()
+    def install_visa_handler(self, event_type, handler, user_handle):
+        self._handlers.append((event_type, handler, user_handle))
+        return user_handle
+    def uninstall_visa_handler(self, event_type, handler, user_handle):
+        for i, h in enumerate(self._handlers):
+            if h[0] == event_type and h[1] is handler:
+                del self._handlers[i]
+                break
+    def enable_event(self, event_type, mechanism):
+        self._srq_mech |= mechanism
+    def disable_event(self, event_type, mechanism):
+        self._srq_mech &= ~mechanism
+    def discard_events(self, event_type, mechanism):
+        with self._events_cond:
+            self._events = []
+    def wait_on_event(self, in_event_type, timeout_ms, capture_timeout=False):
+        end = time.time() + timeout_ms/1000.
+        with self._events_cond:
+            while not self._events:
+                left = end - time.time()
+                if left <= 0:
+                    if capture_timeout:
+                        return _visa_wrap().WaitResponse(0, None, _const('VI_ERROR_TMO'), None, timed_out=True)
+                    raise _error('VI_ERROR_TMO')
+                self._events_cond.wait(left)
+            event_type = self._events.pop(0)
+        return _visa_wrap().WaitResponse(event_type, None, _const('VI_SUCCESS'), None)
+
+_instruments = OrderedDict()
+
+def add_instrument(address, device):
+    """
+    Makes device (a SimDevice) available at the visa address
+    (like 'GPIB0::12' or 'USB0::0x0957::0x0607::MY00000001')
+    """
+    _instruments[_normalize_addr(address)] = device
+
+def remove_instrument(address):
+    del _instruments[_normalize_addr(address)]
+
+def clear_instruments():
+    _instruments.clear()
+
+def _query_regex(query):
+    """
+    Converts a visa resource query (like '?*::INSTR' or 'GPIB?*INSTR') into
+    a python regular expression. The visa syntax is the same except for ?
+    (any one character) and the literal characters. The attribute
+    expressions ({VI_ATTR_...}) are not supported.
+    """
+    if '{' in query:
+        raise ValueError('visa_sim does not support attribute expressions in queries')
+    ret = ''
+    escape = False
+    in_list = False
+    for c in query:
+        if escape:
+            ret += re.escape(c)
+            escape = False
+        elif c == '\\':
+            escape = True
+        elif in_list:
+            if c == '!' and ret.endswith('['):
+                # [!abc] is the visa form of [^abc]
+                c = '^'
+            elif c == ']':
+                in_list = False
+            ret += c
+        elif c == '[':
+            in_list = True
+            ret += c
+        elif c == '?':
+            ret += '.'
+        elif c in '*+|()':
+            ret += c
+        else:
+            ret += re.escape(c)
+    return re.compile(ret+'$', re.IGNORECASE)
+
+class SimResourceManager(object):
+    """
+    A resource manager for the instruments added with add_instrument.
+    Obtain it with visa_wrap.get_resource_manager('sim')
+    """
+    def list_resources(self, query='?*::INSTR'):
+        regex = _query_regex(query)
+        return tuple(addr+'::INSTR' for addr in _instruments if regex.match(addr+'::INSTR'))
+    def resource_info(self, resource_name):
+        normalized = _normalize_addr(resource_name)
+        intf = normalized.split('::')[0]
+        board = int(intf.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ') or 0)
+        return intf.rstrip('0123456789'), board, 'INSTR', normalized+'::INSTR', None
+    def get_instrument_list(self, use_aliases=True):
+        return list(_instruments.keys())
+    def open_resource(self, resource_name, **kwargs):
+        normalized = _normalize_addr(resource_name)
+        if normalized not in _instruments:
+            raise _error('VI_ERROR_RSRC_NFOUND')
+        return SimResource(self, normalized, _instruments[normalized], **kwargs)
+    def is_agilent(self):
+        return False
+    @property
+    def visalib(self):
+        return None
+    def get_gpib_intfc_srq_state(self, bus=0):
+        name = 'GPIB%i'%bus
+        for addr, dev in _instruments.items():
+            if addr.split('::')[0] == name and dev._rqs:
+                return True
+        return False
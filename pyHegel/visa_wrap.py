@@ -32,6 +32,7 @@ from __future__ import absolute_import
 import threading as _threading
 import warnings as _warnings
 import os as _os
+import ctypes as _ctypes
 from ctypes import byref as _byref
 from math import isinf as _isinf
 from distutils.version import LooseVersion
@@ -145,6 +146,8 @@ try:
 except ImportError as exc:
     # give a dummy visa to handle imports
     pyvisa = None
+    # The simulated instruments still work without pyvisa.
+    from .visa_sim import constants, VisaIOError
     print 'Error importing pyVisa (not installed). You will have reduced functionality.'
 
 
@@ -341,6 +344,29 @@ def _write_helper(self, message, termination='default'):
             message += termination
     self.write_raw(message)
 
+def _read_raw_into_helper(self, buf, offset=0, size=None):
+    """
+    Reads at most size bytes (defaults to the space left in buf) into buf
+    (a bytearray or a writable numpy array) starting at offset.
+    Returns the number of bytes read.
+    """
+    if size is None:
+        size = len(buf) - offset
+    data = self.read_raw_n(size)
+    n = len(data)
+    memoryview(buf)[offset:offset+n] = data
+    return n
+
+def _read_raw_n_end_helper(self, size):
+    """
+    Same as read_raw_n but returns (data, ended) where ended is True when
+    the message is complete (no more data to read). Without the visa status,
+    it is guessed from a short read or the termination character.
+    """
+    data = self.read_raw_n(size)
+    term = self.read_termination or '\n'
+    return data, len(data) < size or data.endswith(term)
+
 def _read_helper(self, termination='default'):
     # For old: improved termination handling, matches new interface
     # For new: overides the resource read to remove handling of encoding and add stripping of termination
@@ -544,6 +570,8 @@ class old_Instrument(redirect_instr):
     write = _write_helper
     read = _read_helper
     query = _query_helper
+    read_raw_into = _read_raw_into_helper
+    read_raw_n_end = _read_raw_n_end_helper
 
 
 class new_Instrument(redirect_instr):
@@ -652,6 +680,27 @@ class new_Instrument(redirect_instr):
     def read_raw_n(self, size):
         with self.ignore_warning(constants.VI_SUCCESS_MAX_CNT):
             return self.visalib.read(self.session, size)[0]
+    def read_raw_n_end(self, size):
+        # same as _read_raw_n_end_helper but using the visa status
+        with self.ignore_warning(constants.VI_SUCCESS_MAX_CNT):
+            data, status = self.visalib.read(self.session, size)
+        return data, status != constants.VI_SUCCESS_MAX_CNT
+    def read_raw_into(self, buf, offset=0, size=None):
+        # same as _read_raw_into_helper, but when possible, the visa library
+        # writes directly in buf (no intermediate string).
+        if size is None:
+            size = len(buf) - offset
+        try:
+            viRead = self.visalib.lib.viRead
+            cbuf = (_ctypes.c_ubyte*size).from_buffer(buf, offset)
+            if viRead.argtypes:
+                cbuf = _ctypes.cast(cbuf, viRead.argtypes[1])
+        except (AttributeError, TypeError, ValueError):
+            return _read_raw_into_helper(self, buf, offset, size)
+        count = _ctypes.c_uint32()
+        with self.ignore_warning(constants.VI_SUCCESS_MAX_CNT):
+            viRead(self.session, cbuf, size, _byref(count))
+        return count.value
 
 
 
@@ -843,11 +892,16 @@ def get_resource_manager(path=None):
     """
     if path==None: obeys the try_agilent_first.
     if path='': only load the default library, does not follow try_agilent_first
+    if path='sim': returns the resource manager of the simulated instruments
+                   (see visa_sim). It does not need pyvisa.
     for any other path, load it.
     In case of problem it raises ImportError
     Note that for pyvisa<1.5 only one dll can be loaded at the same time. Loading
     a new one kills the previous one (resource_manager will no longer work.)
     """
+    if path == 'sim':
+        from . import visa_sim
+        return visa_sim.SimResourceManager()
     if pyvisa is None:
         return None
     if old_interface: